@@ -1,59 +1,322 @@
 # app.py — resilient single-client Mongo + Flask app for HUDDLE
 import os
 import sys
-import traceback
+import atexit
+import glob
 import re
-from datetime import datetime
-
-from flask import Flask, request, jsonify, send_from_directory
+import json
+import logging
+import logging.handlers
+import random
+import uuid
+import base64
+import gzip
+import hashlib
+import time
+import queue
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Flask, Response, g, request, jsonify, make_response
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson.objectid import ObjectId
 import bcrypt
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, no segment locking needed
+    fcntl = None
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli for br-encoded static pages
+    brotli = None
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
 # Load .env if present (do NOT commit .env)
 load_dotenv()
 
+# ==================== LOGGING ====================
+# One JSON object per line on stdout. Request threads only enqueue records;
+# a QueueListener thread formats and writes them, so a slow stdout never
+# adds request latency. Records carry the id of the request that emitted
+# them (X-Request-ID, echoed on the response).
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Share of requests whose info/debug records are kept; warnings and errors always are
+LOG_SUCCESS_SAMPLE_RATE = float(os.environ.get("LOG_SUCCESS_SAMPLE_RATE", 1.0))
+
+# Per-thread state of the request being served
+request_trace = threading.local()
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname.lower(),
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "requestId", None):
+            entry["requestId"] = record.requestId
+            entry["route"] = record.route
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the current request and drops info records of unsampled requests"""
+
+    def filter(self, record):
+        record.requestId = getattr(request_trace, "request_id", None)
+        record.route = getattr(request_trace, "route", None)
+        return record.levelno > logging.INFO or getattr(request_trace, "sampled", True)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues without blocking; when the writer falls behind, records are dropped and counted"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render in the caller (args and tracebacks are not safe to hand to another thread)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+log = logging.getLogger("huddle")
+log.setLevel(LOG_LEVEL)
+log.propagate = False
+log_writer = logging.StreamHandler(sys.stdout)
+if LOG_FORMAT == "json":
+    log_writer.setFormatter(JsonLogFormatter())
+else:
+    log_writer.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(requestId)s] %(message)s"))
+log_handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+log_handler.addFilter(RequestContextFilter())
+log.addHandler(log_handler)
+log_listener = logging.handlers.QueueListener(log_handler.queue, log_writer)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 # ==================== FLASK APP INIT ====================
-app = Flask(__name__, static_folder=".", static_url_path="")
+# Files are served by serve_file() from the StaticAssets cache; Flask's own
+# static route would claim the same /<path:filename> rule and bypass it
+app = Flask(__name__, static_folder=None)
+# Values copied from examples and tutorials; anyone could sign session tokens with them
+PLACEHOLDER_SECRET_KEYS = {"change_me", "changeme", "change-me", "secret", "secret_key", "your_secret_key", "your-secret-key", "dev"}
+app.secret_key = os.environ.get("SECRET_KEY")
+if app.secret_key and app.secret_key.strip().lower() in PLACEHOLDER_SECRET_KEYS:
+    raise RuntimeError("SECRET_KEY is a placeholder value. Set a long random key (or leave it empty) before starting.")
+if not app.secret_key and os.environ.get("MONGO_URI"):
+    # Every worker (and restart) must sign with the same key; the connection string is shared and secret
+    log.warning("SECRET_KEY not set. Deriving the session key from MONGO_URI; set SECRET_KEY in production.")
+    app.secret_key = hashlib.sha256(("huddle-session-key:" + os.environ["MONGO_URI"]).encode("utf-8")).hexdigest()
+elif not app.secret_key:
+    log.warning("SECRET_KEY not set. Using a random key; session tokens will not survive restarts.")
+    app.secret_key = os.urandom(32).hex()
 # Allow all origins during development; set a stricter origin in production via env
-CORS(app, resources={r"/*": {"origins": os.environ.get("CORS_ORIGINS", "*")}})
+CORS(app, resources={r"/*": {"origins": os.environ.get("CORS_ORIGINS", "*")}},
+     expose_headers=["X-Session-Token", "X-Session-Invalid", "X-Request-ID"])
+
+# ==================== METRICS ====================
+# Prometheus text exposition at /metrics, kept in-process (each gunicorn
+# worker reports its own series; scrape workers individually or sum them).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 0))
+
+
+class MetricsRegistry:
+    """Counters and histograms keyed by (metric name, label values)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(float)
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def set(self, name, labels, value):
+        """Overwrite a counter with a running total kept elsewhere"""
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @staticmethod
+    def _labels(pairs):
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**h, "counts": list(h["counts"])} for key, h in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text) in sorted(self._help.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, pairs), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._labels(pairs)} {value:g}")
+            else:
+                for (metric, pairs), h in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(h["buckets"], h["counts"]):
+                        lines.append(f"{name}_bucket{self._labels(pairs + (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{name}_bucket{self._labels(pairs + (('le', '+Inf'),))} {h['count']}")
+                    lines.append(f"{name}_sum{self._labels(pairs)} {h['sum']:g}")
+                    lines.append(f"{name}_count{self._labels(pairs)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "counter", "Requests by route, method and status")
+metrics.describe("http_request_duration_seconds", "histogram", "Time spent in the handler by route")
+metrics.describe("http_response_bytes", "histogram", "Response body size by route")
+metrics.describe("http_request_mongo_commands", "histogram", "Mongo commands issued per request by route")
+metrics.describe("mongo_commands_total", "counter", "Mongo commands by route, command and outcome")
+metrics.describe("mongo_command_duration_seconds", "histogram", "Mongo command round trip by command")
+metrics.describe("log_records_dropped_total", "counter", "Log records dropped because the log writer fell behind")
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command and attributes it to the request that issued it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        trace = getattr(request_trace, "commands", None)
+        route = getattr(request_trace, "route", "background") if trace is not None else "background"
+        metrics.inc("mongo_commands_total", {"route": route, "command": event.command_name, "outcome": outcome})
+        metrics.observe("mongo_command_duration_seconds", {"command": event.command_name}, seconds)
+        if trace is not None:
+            trace.append((event.command_name, collection, seconds, outcome))
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+@app.before_request
+def start_request_trace():
+    request_trace.request_id = (request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])[:64]
+    request_trace.sampled = random.random() < LOG_SUCCESS_SAMPLE_RATE
+    request_trace.route = request.url_rule.rule if request.url_rule else "unmatched"
+    request_trace.commands = []
+    request_trace.started = time.perf_counter()
 
-# ==================== MONGO CONNECTION (single client, robust) ====================
 
-# Disable caching for HTML files
 @app.after_request
-def add_no_cache_headers(response):
-    if request.path.endswith('.html'):
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+def record_request_metrics(response):
+    started = getattr(request_trace, "started", None)
+    if started is None:
+        return response
+    response.headers["X-Request-ID"] = request_trace.request_id
+    seconds = time.perf_counter() - started
+    route = request_trace.route
+    commands = request_trace.commands
+    metrics.inc("http_requests_total", {"route": route, "method": request.method, "status": str(response.status_code)})
+    metrics.observe("http_request_duration_seconds", {"route": route, "method": request.method}, seconds)
+    metrics.observe("http_request_mongo_commands", {"route": route}, len(commands), buckets=COUNT_BUCKETS)
+    if response.content_length is not None:  # streamed responses (SSE) have no length
+        metrics.observe("http_response_bytes", {"route": route}, response.content_length, buckets=BYTES_BUCKETS)
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        log.warning(f"Slow request {request.method} {request.path}", extra={"fields": {
+            "status": response.status_code,
+            "durationMs": round(seconds * 1000, 1),
+            "mongoMs": round(sum(c[2] for c in commands) * 1000, 1),
+            "mongoCommands": [
+                {"command": name, "collection": coll, "ms": round(secs * 1000, 1), "outcome": outcome}
+                for name, coll, secs, outcome in commands
+            ]
+        }})
     return response
 
+
+@app.teardown_request
+def clear_request_trace(exc):
+    request_trace.__dict__.clear()
+
+
+# ==================== MONGO CONNECTION (single client, robust) ====================
+
 MONGO_URI = os.environ.get("MONGO_URI")
 
 
 def connect_mongo(uri, retries=2, timeout_ms=5000):
     if not uri:
-        print("⚠️  MONGO_URI not set. Set the MONGO_URI environment variable or use a .env file.")
+        log.warning("MONGO_URI not set. Set the MONGO_URI environment variable or use a .env file.")
         return None
     for attempt in range(1, retries + 2):
         try:
-            client = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms)
+            # One pool shared by every worker thread/greenlet in this process
+            client = MongoClient(
+                uri,
+                serverSelectionTimeoutMS=timeout_ms,
+                maxPoolSize=int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+                event_listeners=[MongoCommandMetrics()]
+            )
             client.admin.command("ping")
-            print("✅ CAN PING CLUSTER")
-            try:
-                dbs = client.list_database_names()
-                print("Databases visible to client:", dbs)
-            except Exception:
-                pass
+            log.info("Connected to MongoDB")
             return client
         except Exception as e:
-            print(f"❌ Mongo connect attempt {attempt} failed: {e}")
-            traceback.print_exc(limit=1)
+            log.exception(f"Mongo connect attempt {attempt} failed: {e}")
             if attempt <= retries:
-                import time
                 time.sleep(2)
     return None
 
@@ -67,25 +330,10 @@ if mongo_client:
     try:
         student_db = mongo_client["student_network_db"]
         chat_db = mongo_client["chat_db"]
-
-        try:
-            print("\n   Database: student_network_db")
-            print("   Collections:", student_db.list_collection_names())
-        except Exception as e:
-            print("   Could not list student_network_db collections:", e)
-
-        try:
-            print("\n   Database: chat_db")
-            print("   Collections:", chat_db.list_collection_names())
-        except Exception as e:
-            print("   Could not list chat_db collections:", e)
-
-        print("")
     except Exception as e:
-        print("❌ Error while creating DB handles:", e)
-        traceback.print_exc(limit=1)
+        log.exception(f"Error while creating DB handles: {e}")
 else:
-    print("❌ Could not create Mongo client. DB handles are None.")
+    log.error("Could not create Mongo client. DB handles are None.")
 
 
 def get_collection_safe(db, name):
@@ -94,51 +342,1015 @@ def get_collection_safe(db, name):
     return db[name]
 
 
+def to_object_ids(ids):
+    """Convert ids to ObjectIds, dropping blanks and malformed values"""
+    object_ids = set()
+    for raw_id in ids:
+        if not raw_id:
+            continue
+        try:
+            object_ids.add(ObjectId(str(raw_id)))
+        except Exception:
+            pass
+    return list(object_ids)
+
+
+def fetch_by_ids(collection, ids, projection=None):
+    """Resolve many ids with a single $in query; returns {str(_id): doc}"""
+    object_ids = to_object_ids(ids)
+    if not object_ids:
+        return {}
+    return {str(doc["_id"]): doc for doc in collection.find({"_id": {"$in": object_ids}}, projection)}
+
+
+def ensure_unread_counters(db, user_ids):
+    """Create any missing counter from the user's stored unread notifications.
+
+    Call it before changing the notifications whose count is then applied with
+    $inc. The counter is created by a unique insert, so exactly one caller's
+    count wins, and that count was taken before any change that a concurrent
+    caller (whose insert then loses) goes on to $inc.
+    """
+    counters_collection = get_collection_safe(db, "notification_counters")
+    notifications_collection = get_collection_safe(db, "notifications")
+    user_ids = {str(user_id) for user_id in user_ids}
+    existing = {doc["userId"] for doc in counters_collection.find({"userId": {"$in": list(user_ids)}}, {"userId": 1})}
+    for user_id in user_ids - existing:
+        stored = notifications_collection.count_documents({"userId": user_id, "isRead": False})
+        try:
+            counters_collection.insert_one({"userId": user_id, "unread": stored})
+        except DuplicateKeyError:
+            pass  # another caller created it first
+
+
+def adjust_unread_count(user_id, delta):
+    """Keep notification_counters.unread in step with notifications.isRead (after ensure_unread_counters)"""
+    if not delta:
+        return
+    counters_collection = get_collection_safe(student_db, "notification_counters")
+    counters_collection.update_one({"userId": str(user_id)}, {"$inc": {"unread": delta}})
+
+
+def mark_notifications_read(notifications_collection, query):
+    """Mark the unread notifications matching query (which must pin userId) read and decrement the badge"""
+    query = {**query, "isRead": False}
+    ensure_unread_counters(student_db, [query["userId"]])
+    result = notifications_collection.update_many(query, {"$set": {"isRead": True, "readAt": datetime.utcnow()}})
+    adjust_unread_count(query["userId"], -result.modified_count)
+    return result.modified_count
+
+
+class NotificationDispatcher:
+    """Background writer for notifications so request handlers never wait on them.
+
+    Notifications are queued in memory and flushed with insert_many when
+    batch_size is reached or flush_interval_s passes. Failed batches are
+    retried with exponential backoff, then appended to a local JSONL spool
+    that is replayed on the next successful flush. Every notification gets
+    its _id when queued, so a replay never inserts a duplicate. The spool is
+    shared by all workers, so appends and replays hold an flock on it. At
+    shutdown the batch the worker thread holds (possibly asleep in backoff)
+    is written or spooled along with the queue.
+    """
+
+    def __init__(self, get_db, spool_path, batch_size=100, flush_interval_s=0.5, max_retries=3):
+        self.get_db = get_db
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_retries = max_retries
+        self._queue = queue.Queue()
+        self._spool_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._in_flight_lock = threading.Lock()
+        self._in_flight = []
+        self._worker = None
+        self._worker_pid = None
+
+    def enqueue(self, notification):
+        self._ensure_worker()
+        self._queue.put(notification)
+
+    def _ensure_worker(self):
+        # Started lazily and per process: a thread started before gunicorn forks does not survive the fork
+        if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._in_flight_lock:
+                self._in_flight = batch
+            self._write_with_retry(batch)
+            with self._in_flight_lock:
+                self._in_flight = []
+
+    def flush(self):
+        """Synchronously write everything still queued or held by the worker (used at shutdown).
+
+        Stopping cuts the worker's backoff short; it spools what it holds and
+        exits. A batch it is still stuck inserting after a grace period is
+        written here too (the _ids make a second insert or replay a no-op).
+        Queued notifications get one attempt, then the spool.
+        """
+        self._stopping.set()
+        if self._worker is not None and self._worker_pid == os.getpid():
+            self._worker.join(timeout=5)
+        with self._in_flight_lock:
+            batch = list(self._in_flight)
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write_with_retry(batch, max_retries=0)
+
+    def _write_with_retry(self, batch, max_retries=None):
+        retries = self.max_retries if max_retries is None else max_retries
+        pending = batch
+        for attempt in range(retries + 1):
+            try:
+                pending = self._insert(pending)
+            except Exception as e:
+                log.error(f"Notification flush attempt {attempt + 1} failed: {e}")
+            if not pending:
+                break
+            if attempt < retries and self._stopping.wait(min(0.2 * (2 ** attempt), 5)):
+                break  # shutting down: spool what is left instead of waiting
+        if pending:
+            self._spool(pending)
+            return
+        try:
+            self._replay_spool()
+        except Exception as e:
+            log.error(f"Notification spool replay failed: {e}")
+
+    def _insert(self, batch):
+        """Insert a batch and bump unread counters; returns the notifications that still need writing"""
+        if not batch:
+            return []
+        notifications_collection = get_collection_safe(self.get_db(), "notifications")
+        counters_collection = get_collection_safe(self.get_db(), "notification_counters")
+        failed, duplicates = set(), set()
+        ensure_unread_counters(self.get_db(), {notification["userId"] for notification in batch})
+        try:
+            notifications_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as bulk_err:
+            for error in bulk_err.details.get("writeErrors", []):
+                # A duplicate _id means an earlier attempt already wrote (and counted) it
+                (duplicates if error.get("code") == 11000 else failed).add(error["index"])
+
+        unread = defaultdict(int)
+        for index, notification in enumerate(batch):
+            if index not in failed and index not in duplicates:
+                unread[notification["userId"]] += 1
+        if unread:
+            counters_collection.bulk_write([
+                UpdateOne({"userId": user_id}, {"$inc": {"unread": count}})
+                for user_id, count in unread.items()
+            ], ordered=False)
+        return [notification for index, notification in enumerate(batch) if index in failed]
+
+    @staticmethod
+    def _spool_line(notification):
+        return json.dumps({
+            **notification,
+            "_id": str(notification["_id"]),
+            "createdAt": notification["createdAt"].isoformat()
+        }) + "\n"
+
+    def _open_locked_spool(self):
+        """Open the spool for append and read, holding an exclusive flock (released on close)"""
+        spool = open(self.spool_path, "a+", encoding="utf-8")
+        if fcntl:
+            fcntl.flock(spool.fileno(), fcntl.LOCK_EX)
+        return spool
+
+    def _spool(self, batch):
+        with self._spool_lock, self._open_locked_spool() as spool:
+            for notification in batch:
+                spool.write(self._spool_line(notification))
+            spool.flush()
+            os.fsync(spool.fileno())
+        log.warning(f"Spooled {len(batch)} notifications to {self.spool_path}")
+
+    def _replay_spool(self):
+        if not os.path.exists(self.spool_path) or os.path.getsize(self.spool_path) == 0:
+            return
+        # Read, insert and rewrite under one lock so no other worker can append in between
+        with self._spool_lock, self._open_locked_spool() as spool:
+            spool.seek(0)
+            batch = [json.loads(line) for line in spool if line.strip()]
+            if not batch:
+                return
+            for notification in batch:
+                notification["_id"] = ObjectId(notification["_id"])
+                notification["createdAt"] = datetime.fromisoformat(notification["createdAt"])
+            remaining = self._insert(batch)
+            spool.seek(0)
+            spool.truncate()
+            for notification in remaining:
+                spool.write(self._spool_line(notification))
+            spool.flush()
+            os.fsync(spool.fileno())
+        log.info(f"Replayed {len(batch) - len(remaining)} spooled notifications")
+
+
+notification_dispatcher = NotificationDispatcher(
+    get_db=lambda: student_db,
+    spool_path=os.environ.get("NOTIFICATION_SPOOL_PATH", "notification_spool.jsonl"),
+    batch_size=int(os.environ.get("NOTIFICATION_BATCH_SIZE", 100)),
+    flush_interval_s=float(os.environ.get("NOTIFICATION_FLUSH_INTERVAL", 0.5)),
+    max_retries=int(os.environ.get("NOTIFICATION_MAX_RETRIES", 3))
+)
+atexit.register(notification_dispatcher.flush)
+
+
 def create_notification(user_id, notification_type, from_user_id, group_id, message):
-    """Helper to create notifications"""
-    try:
-        notifications_collection = get_collection_safe(student_db, "notifications")
-        notification = {
-            "userId": str(user_id),
-            "fromUserId": str(from_user_id),
-            "groupId": str(group_id),
-            "type": notification_type,
-            "message": message,
-            "isRead": False,
-            "createdAt": datetime.utcnow()
-        }
-        result = notifications_collection.insert_one(notification)
-        print(f"✅ Notification created for user {user_id}")
-        return str(result.inserted_id)
-    except Exception as e:
-        print(f"❌ Failed to create notification: {e}")
-        return None
+    """Queue a notification for the background dispatcher; returns its id immediately"""
+    notification = {
+        "_id": ObjectId(),
+        "userId": str(user_id),
+        "fromUserId": str(from_user_id),
+        "groupId": str(group_id),
+        "type": notification_type,
+        "message": message,
+        "isRead": False,
+        "createdAt": datetime.utcnow()
+    }
+    notification_dispatcher.enqueue(notification)
+    return str(notification["_id"])
+
+
+# ==================== INDEXES ====================
+# Each route section declares the indexes its queries rely on; they are
+# created at boot (ENSURE_INDEXES_ON_BOOT) or with `flask ensure-indexes`.
+REQUIRED_INDEXES = []
+
+
+def declare_index(db_name, collection_name, keys, **options):
+    options.setdefault("name", "_".join(f"{field}_{direction}" for field, direction in keys))
+    REQUIRED_INDEXES.append((db_name, collection_name, keys, options))
+
+
+def database_by_name(db_name):
+    return {"student_network_db": student_db, "chat_db": chat_db}.get(db_name)
+
+
+def ensure_indexes():
+    """Create every declared index; create_index is a no-op when it already exists"""
+    created, failed = [], []
+    for db_name, collection_name, keys, options in REQUIRED_INDEXES:
+        try:
+            collection = get_collection_safe(database_by_name(db_name), collection_name)
+            collection.create_index(keys, **options)
+            created.append(f"{db_name}.{collection_name}.{options['name']}")
+        except Exception as e:
+            failed.append(f"{db_name}.{collection_name}.{options['name']}: {e}")
+    return created, failed
+
+
+def ensure_indexes_on_boot():
+    """Run ensure_indexes at import unless ENSURE_INDEXES_ON_BOOT=0; called once every section has declared its indexes"""
+    if not mongo_client or os.environ.get("ENSURE_INDEXES_ON_BOOT", "1") != "1":
+        return
+    _, failed = ensure_indexes()
+    for failure in failed:
+        log.error(f"Index not created: {failure}")
+
+
+def index_report():
+    """Return (missing, unused) index names: declared-but-absent and present-but-never-used"""
+    missing, unused = [], []
+    seen = set()
+    for db_name, collection_name, keys, options in REQUIRED_INDEXES:
+        collection = get_collection_safe(database_by_name(db_name), collection_name)
+        indexes = collection.index_information()
+        existing = {tuple(info["key"]) for info in indexes.values()}
+        if options["name"] not in indexes and tuple(keys) not in existing:
+            missing.append(f"{db_name}.{collection_name}.{options['name']}")
+        if (db_name, collection_name) in seen:
+            continue
+        seen.add((db_name, collection_name))
+        for stats in collection.aggregate([{"$indexStats": {}}]):
+            if stats["name"] != "_id_" and stats.get("accesses", {}).get("ops", 0) == 0:
+                unused.append(f"{db_name}.{collection_name}.{stats['name']}")
+    return missing, unused
 
 
 # ==================== UTILITIES ====================
+class PasswordHasherBusy(Exception):
+    """Raised when every bcrypt slot (running + queued) is taken"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated pool so a login burst cannot occupy every request worker.
+
+    bcrypt releases the GIL while hashing, so threads give real parallelism
+    here. At most `workers` hashes run and `max_queue` wait; anything beyond
+    that is rejected immediately with PasswordHasherBusy.
+    """
+
+    def __init__(self, workers, max_queue, rounds, timeout_s):
+        self.rounds = rounds
+        self.timeout_s = timeout_s
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout_s)
+        except FutureTimeoutError:
+            raise PasswordHasherBusy()
+
+    def hash(self, password: str) -> bytes:
+        return self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+
+    def verify(self, password: str, pw_hash: bytes) -> bool:
+        try:
+            return self._run(bcrypt.checkpw, password.encode("utf-8"), pw_hash)
+        except PasswordHasherBusy:
+            raise
+        except Exception:
+            return False
+
+    def needs_rehash(self, pw_hash: bytes) -> bool:
+        try:
+            return int(bytes(pw_hash).split(b"$")[2]) != self.rounds
+        except Exception:
+            return False
+
+
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get("BCRYPT_WORKERS", os.cpu_count() or 2)),
+    max_queue=int(os.environ.get("BCRYPT_QUEUE", 32)),
+    rounds=int(os.environ.get("BCRYPT_ROUNDS", 12)),
+    timeout_s=float(os.environ.get("BCRYPT_TIMEOUT", 10))
+)
+PASSWORD_RETRY_AFTER_SECONDS = 2
+
+
 def hash_password(password: str) -> bytes:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    return password_hasher.hash(password)
 
 
 def check_password(password: str, pw_hash: bytes) -> bool:
+    return password_hasher.verify(password, pw_hash)
+
+
+def hasher_busy_response():
+    response = jsonify({'error': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = str(PASSWORD_RETRY_AFTER_SECONDS)
+    return response, 503
+
+
+def parse_team_size(preferred_team_size):
+    """Normalize free-text team size ("4", "3-5 people") to an int, or None"""
+    if not preferred_team_size:
+        return None
+    match = re.search(r'(\d+)', str(preferred_team_size))
+    if match:
+        return int(match.group(1))
     try:
-        return bcrypt.checkpw(password.encode("utf-8"), pw_hash)
+        return int(preferred_team_size)
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_cursor(sort_value, object_id):
+    """Opaque keyset cursor for the last row of a page: (sort value, _id)"""
+    if isinstance(sort_value, datetime):
+        payload = {"t": "d", "v": sort_value.isoformat()}
+    else:
+        payload = {"t": "n", "v": sort_value}
+    payload["id"] = str(object_id)
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value = payload["v"]
+        if payload.get("t") == "d":
+            value = datetime.fromisoformat(value)
+        return value, ObjectId(payload["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_filter(field, sort_value, object_id, direction=-1):
+    """Rows strictly after (sort_value, _id) in a (field, _id) sort.
+
+    Null and missing values sort below every other value, but a comparison
+    against a value never matches them (type bracketing), so they get their
+    own branch: after any value when descending, before any when ascending.
+    """
+    op = "$lt" if direction < 0 else "$gt"
+    clauses = [
+        {field: {op: sort_value}},
+        {field: sort_value, "_id": {op: object_id}}
+    ]
+    if sort_value is not None and direction < 0:
+        clauses.append({field: None})
+    elif sort_value is None and direction > 0:
+        clauses[0] = {field: {"$ne": None}}
+    return {"$or": clauses}
+
+
+def parse_bool_arg(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+# ==================== REAL-TIME PUSH ====================
+class LocalPubSub:
+    """In-process fan-out of events to Server-Sent Events subscribers.
+
+    Only reaches clients connected to the same worker process; with several
+    gunicorn workers, MongoPubSub carries events between them.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            self._subscribers[channel].discard(subscriber)
+            if not self._subscribers[channel]:
+                del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        """Deliver to every subscriber of channel; slow subscribers drop events rather than block"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        delivered = 0
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+                delivered += 1
+            except queue.Full:
+                pass
+        return delivered
+
+
+class MongoPubSub(LocalPubSub):
+    """Pub/sub shared by every worker through a change stream on realtime_events.
+
+    publish() inserts the event; each process runs one watcher thread that
+    hands inserted events to its local subscribers, including the
+    publisher's own. Needs a replica set (Atlas always is one).
+    """
+
+    def __init__(self, get_db, max_queue=100):
+        super().__init__(max_queue)
+        self.get_db = get_db
+        self._watcher = None
+        self._watcher_pid = None
+
+    def subscribe(self, channel):
+        self._ensure_watcher()
+        return super().subscribe(channel)
+
+    def publish(self, channel, event):
+        event_name, payload = event
+        try:
+            events_collection = get_collection_safe(self.get_db(), "realtime_events")
+            events_collection.insert_one({
+                "channel": channel, "name": event_name, "payload": payload, "createdAt": datetime.utcnow()
+            })
+        except Exception as e:
+            log.error(f"Shared publish of {event_name} on {channel} failed, delivering locally: {e}")
+            super().publish(channel, event)
+
+    def _ensure_watcher(self):
+        # Per process: a thread started before gunicorn forks does not survive the fork
+        if self._watcher is None or self._watcher_pid != os.getpid() or not self._watcher.is_alive():
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch, name="pubsub-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        resume_token = None
+        failures = 0
+        while True:
+            try:
+                events_collection = get_collection_safe(self.get_db(), "realtime_events")
+                pipeline = [{"$match": {"operationType": "insert"}}]
+                with events_collection.watch(pipeline, resume_after=resume_token) as stream:
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        failures = 0
+                        event = change["fullDocument"]
+                        LocalPubSub.publish(self, event["channel"], (event["name"], event["payload"]))
+            except Exception as e:
+                log.error(f"Pub/sub change stream failed, reconnecting: {e}")
+                failures += 1
+                if failures > 1:
+                    resume_token = None  # the token itself may be the problem (e.g. aged out of the oplog)
+                time.sleep(1)
+
+
+declare_index("student_network_db", "realtime_events", [("createdAt", 1)], expireAfterSeconds=3600)
+
+
+def make_pubsub():
+    """Shared pub/sub when Mongo is a replica set (change streams), otherwise in-process only"""
+    backend = os.environ.get("PUBSUB_BACKEND", "auto")
+    if backend != "local" and mongo_client is not None:
+        try:
+            if mongo_client.admin.command("hello").get("setName") or backend == "mongo":
+                return MongoPubSub(get_db=lambda: student_db)
+        except Exception as e:
+            log.warning(f"Could not check for change stream support ({e})")
+    if int(os.environ.get("GUNICORN_WORKERS", 1)) > 1:
+        log.warning("Pub/sub is in-process only; live updates reach only clients on the same worker")
+    return LocalPubSub()
+
+
+pubsub = make_pubsub()
+SSE_HEARTBEAT_SECONDS = 15
+# Each open SSE stream or chat long poll occupies a worker thread; keep some for ordinary requests
+MAX_STREAMS_PER_WORKER = int(os.environ.get("MAX_STREAMS_PER_WORKER", 16))
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS_PER_WORKER)
+
+
+def acquire_stream_slot():
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot():
+    _stream_slots.release()
+
+
+def publish_event(channel, event_name, payload):
+    try:
+        pubsub.publish(channel, (event_name, payload))
+    except Exception as e:
+        log.error(f"Failed to publish {event_name} on {channel}: {e}")
+
+
+def event_stream_response(channel):
+    """Stream a pub/sub channel to the client as text/event-stream (503 when this worker is at its stream limit)"""
+    if not acquire_stream_slot():
+        response = jsonify({"error": "Too many open streams, retry shortly"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    try:
+        subscriber = pubsub.subscribe(channel)
     except Exception:
-        return False
+        release_stream_slot()
+        raise
+    closed = threading.Event()
+
+    def close():
+        # Runs when the response is closed, whether or not the generator ever started
+        if not closed.is_set():
+            closed.set()
+            pubsub.unsubscribe(channel, subscriber)
+            release_stream_slot()
+
+    def generate():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event_name, payload = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event_name}\ndata: {json.dumps(payload, default=str)}\n\n"
+        finally:
+            close()
+
+    response = Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    response.call_on_close(close)
+    return response
+
+
+# ==================== SESSIONS ====================
+# login_api() issues a signed token carrying the user id and the groups they
+# belong to / lead. Routes wrapped in @with_session trust it without a DB read.
+# The membership snapshot only ever grants access while it is younger than
+# SESSION_SNAPSHOT_MAX_AGE. An older one is re-read once and the refreshed
+# token is returned in X-Session-Token for the page to store, so the group
+# lookup happens once per snapshot period rather than on every request.
+session_serializer = URLSafeTimedSerializer(app.secret_key, salt="huddle-session")
+SESSION_MAX_AGE = int(os.environ.get("SESSION_MAX_AGE", 7 * 24 * 3600))
+SESSION_SNAPSHOT_MAX_AGE = int(os.environ.get("SESSION_SNAPSHOT_MAX_AGE", 600))
+REQUIRE_SESSION_TOKEN = os.environ.get("REQUIRE_SESSION_TOKEN", "0") == "1"
+
+
+def issue_session_token(user_id, logged_in_at=None):
+    """Sign a token with a fresh membership snapshot; logged_in_at carries the original login across refreshes"""
+    groups_collection = get_collection_safe(student_db, "groups")
+    groups = list(groups_collection.find({"members": str(user_id)}, {"_id": 1, "creatoruserid": 1}))
+    return session_serializer.dumps({
+        "uid": str(user_id),
+        "loginAt": logged_in_at or int(time.time()),
+        "groups": [str(group["_id"]) for group in groups],
+        "leads": [str(group["_id"]) for group in groups if str(group.get("creatoruserid")) == str(user_id)]
+    })
+
+
+def with_session(view):
+    """Verify a bearer token (header, or ?token= for EventSource) into g.session.
+
+    Requests without a token keep working on client-supplied ids unless
+    REQUIRE_SESSION_TOKEN=1. A bad or expired token is then rejected with
+    401; otherwise it is ignored and flagged with X-Session-Invalid so the
+    page can drop it.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.session = None
+        header = request.headers.get("Authorization", "")
+        token = header[7:] if header.startswith("Bearer ") else request.args.get("token")
+        refreshed_token = None
+        invalid = None
+        if token:
+            try:
+                payload, signed_at = session_serializer.loads(token, max_age=SESSION_MAX_AGE, return_timestamp=True)
+                if time.time() - payload.get("loginAt", signed_at.timestamp()) > SESSION_MAX_AGE:
+                    raise SignatureExpired("Session expired")
+            except SignatureExpired:
+                invalid = "Session expired"
+            except BadSignature:
+                invalid = "Invalid session"
+            else:
+                age = (datetime.utcnow() - signed_at.replace(tzinfo=None)).total_seconds()
+                if age > SESSION_SNAPSHOT_MAX_AGE:
+                    try:
+                        refreshed_token = issue_session_token(payload["uid"], payload.get("loginAt"))
+                        payload = session_serializer.loads(refreshed_token)
+                        age = 0
+                    except Exception as e:
+                        log.warning(f"Session snapshot refresh failed: {e}")
+                g.session = {**payload, "snapshotFresh": age <= SESSION_SNAPSHOT_MAX_AGE}
+        if invalid and REQUIRE_SESSION_TOKEN:
+            return jsonify({"error": invalid}), 401
+        if not g.session and REQUIRE_SESSION_TOKEN:
+            return jsonify({"error": "Authentication required"}), 401
+
+        response = make_response(view(*args, **kwargs))
+        if refreshed_token:
+            response.headers["X-Session-Token"] = refreshed_token
+        if invalid:
+            response.headers["X-Session-Invalid"] = invalid
+        return response
+    return wrapper
+
+
+def session_user_id(supplied_user_id):
+    """The caller's user id: the token's when present, else the client-supplied one"""
+    if g.get("session"):
+        return g.session["uid"]
+    return str(supplied_user_id)
+
+
+def session_in_group(group_id, role="groups"):
+    """True when a fresh token snapshot already proves membership (role="groups") or leadership ("leads")"""
+    session = g.get("session")
+    return bool(session and session["snapshotFresh"] and str(group_id) in session.get(role, []))
+
+
+def is_group_member(groups_collection, group_id, user_id):
+    if session_in_group(group_id):
+        return True
+    group = groups_collection.find_one({"_id": ObjectId(group_id), "members": str(user_id)}, {"_id": 1})
+    return group is not None
+
+
+# ==================== RESPONSE CACHE ====================
+# Hot read endpoints cache their JSON body keyed by route + args. Entries are
+# grouped under tags ("groups", "user:<id>", ...); writes bump a tag's version,
+# which makes every key built with the old version unreachable. Tag versions
+# live in Mongo (or Redis) so a write in one worker invalidates all of them.
+class MongoTagVersions:
+    """Tag version counters in one small collection, shared by every worker"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def versions(self, tags):
+        if not tags:
+            return []
+        found = {doc["_id"]: doc["v"] for doc in self._collection.find({"_id": {"$in": list(tags)}})}
+        return [found.get(tag, 0) for tag in tags]
+
+    def bump(self, tag):
+        self._collection.update_one({"_id": tag}, {"$inc": {"v": 1}}, upsert=True)
+
+
+class LocalCacheBackend:
+    """In-process LRU with per-entry TTL; tag versions are per-process unless a shared tag_store is given"""
+
+    def __init__(self, max_entries=2048, tag_store=None):
+        self.max_entries = max_entries
+        self.tag_store = tag_store
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = defaultdict(int)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def versions(self, tags):
+        if self.tag_store is not None:
+            return self.tag_store.versions(tags)
+        with self._lock:
+            return [self._versions[tag] for tag in tags]
+
+    def bump(self, tag):
+        if self.tag_store is not None:
+            return self.tag_store.bump(tag)
+        with self._lock:
+            self._versions[tag] += 1
+
+
+class RedisCacheBackend:
+    """Shared cache for several workers/hosts; needs the redis package"""
+
+    def __init__(self, url, namespace="cache"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = f"huddle:{namespace}:"
+
+    def get(self, key):
+        raw = self._redis.get(self._prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value, ttl_seconds):
+        self._redis.set(self._prefix + key, json.dumps(value), ex=ttl_seconds)
+
+    def delete(self, key):
+        self._redis.delete(self._prefix + key)
+
+    def versions(self, tags):
+        if not tags:
+            return []
+        return [int(v or 0) for v in self._redis.mget(["huddle:tag:" + tag for tag in tags])]
+
+    def bump(self, tag):
+        self._redis.incr("huddle:tag:" + tag)
+
+
+def make_cache_backend(namespace="cache", max_entries=2048, tag_store=None):
+    redis_url = os.environ.get("CACHE_REDIS_URL")
+    if redis_url:
+        try:
+            return RedisCacheBackend(redis_url, namespace)
+        except Exception as e:
+            log.warning(f"Shared cache unavailable ({e}); using in-process cache")
+    return LocalCacheBackend(max_entries, tag_store)
+
+
+cache_backend = make_cache_backend(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 2048)),
+    tag_store=MongoTagVersions(student_db["cache_tags"]) if student_db is not None else None
+)
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 30))
+cache_stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+cache_stats_lock = threading.Lock()
+
+
+def invalidate_cache(*tags):
+    for tag in tags:
+        try:
+            cache_backend.bump(tag)
+        except Exception as e:
+            log.error(f"Cache invalidation failed for {tag}: {e}")
+
+
+def cached_response(*tags, ttl=None):
+    """Cache a view's 200 JSON response. Tags may be strings or callables taking the view kwargs."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not RESPONSE_CACHE_ENABLED:
+                return view(*args, **kwargs)
+            entry_tags = [tag(**kwargs) if callable(tag) else tag for tag in tags]
+            body = request.get_data(as_text=True) if request.method == 'POST' else ''
+            try:
+                versions = cache_backend.versions(entry_tags)
+                # Views under @with_session answer for the token's user, whatever the query string says
+                session = g.get("session")
+                key = "|".join([
+                    request.path,
+                    f"uid={session['uid']}" if session else "",
+                    ",".join(f"{t}@{v}" for t, v in zip(entry_tags, versions)),
+                    "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True))),
+                    body
+                ])
+                hit = cache_backend.get(key)
+            except Exception as e:
+                log.error(f"Cache lookup failed: {e}")
+                return view(*args, **kwargs)
+
+            with cache_stats_lock:
+                cache_stats[request.endpoint]["hits" if hit is not None else "misses"] += 1
+            if hit is not None:
+                response = app.response_class(hit["body"], status=200, mimetype=hit["mimetype"])
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                try:
+                    cache_backend.set(key, {
+                        "body": response.get_data(as_text=True),
+                        "mimetype": response.mimetype
+                    }, ttl or RESPONSE_CACHE_TTL)
+                except Exception as e:
+                    log.error(f"Cache store failed: {e}")
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
 
 
 # ==================== HTML ROUTES ====================
+# Pages and assets are read once, fingerprinted and compressed in memory.
+# Browsers revalidate pages with ETag/Last-Modified (a 304 costs no body);
+# local src/href references are rewritten to name?v=<hash>, and those URLs
+# are cached as immutable until a deploy changes the file.
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".ico": "image/x-icon",
+    ".woff2": "font/woff2",
+}
+STATIC_COMPRESSIBLE = {".html", ".css", ".js", ".svg"}
+STATIC_MIN_COMPRESS_BYTES = 1024
+STATIC_REF_PATTERN = re.compile(r"""((?:src|href)=["'])([\w./-]+?)(["'])""")
+
+
+class StaticAsset:
+    def __init__(self, name, body, mtime):
+        self.name = name
+        self.mtime = mtime
+        self.content_type = STATIC_TYPES[os.path.splitext(name)[1].lower()]
+        self.set_body(body)
+
+    def set_body(self, body):
+        self.fingerprint = hashlib.sha256(body).hexdigest()[:12]
+        self.variants = {None: body}
+        if os.path.splitext(self.name)[1].lower() in STATIC_COMPRESSIBLE and len(body) >= STATIC_MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli:
+                self.variants["br"] = brotli.compress(body, quality=11)
+
+
+class StaticAssets:
+    """In-memory, precompressed copies of the servable files in STATIC_ROOT"""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._assets = {}
+
+    def build(self):
+        assets = {}
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.splitext(name)[1].lower() in STATIC_TYPES and os.path.isfile(path):
+                with open(path, "rb") as f:
+                    assets[name] = StaticAsset(name, f.read(), int(os.path.getmtime(path)))
+
+        def fingerprinted(match):
+            target = assets.get(match.group(2))
+            if target is None or target.name.endswith(".html"):
+                return match.group(0)  # page links stay stable for bookmarks and redirects
+            return f"{match.group(1)}{match.group(2)}?v={target.fingerprint}{match.group(3)}"
+
+        for asset in assets.values():
+            if asset.name.endswith((".html", ".css")):
+                text = asset.variants[None].decode("utf-8")
+                rewritten = STATIC_REF_PATTERN.sub(fingerprinted, text)
+                if rewritten != text:
+                    asset.set_body(rewritten.encode("utf-8"))
+        with self._lock:
+            self._assets = assets
+        log.info(f"Static assets built: {len(assets)} files{'' if brotli else ' (gzip only, brotli not installed)'}")
+
+    def get(self, name):
+        if os.path.basename(name) != name:
+            return None  # only top-level files are served
+        with self._lock:
+            asset = self._assets.get(name)
+        path = os.path.join(self.root, name)
+        try:
+            mtime = int(os.path.getmtime(path))
+        except OSError:
+            return None
+        changed = asset is None or mtime != asset.mtime
+        if changed and os.path.splitext(name)[1].lower() in STATIC_TYPES:
+            self.build()  # edited in place (dev) or added since startup
+            with self._lock:
+                asset = self._assets.get(name)
+        return asset
+
+
+static_assets = StaticAssets(STATIC_ROOT)
+static_assets.build()
+
+
+def static_response(name):
+    asset = static_assets.get(name)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    encoding = next((e for e in ("br", "gzip") if e in asset.variants and request.accept_encodings[e]), None)
+    response = Response(asset.variants[encoding], content_type=asset.content_type)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.set_etag(f"{asset.fingerprint}-{encoding}" if encoding else asset.fingerprint)
+    response.last_modified = asset.mtime
+    if request.args.get("v") == asset.fingerprint:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
 @app.route('/')
 def index():
-    return send_from_directory('.', 'frontpage.html')
+    return static_response('frontpage.html')
 
 
 @app.route('/<path:filename>')
 def serve_file(filename):
-    return send_from_directory('.', filename)
+    return static_response(filename)
 
 
 # ==================== AUTH ROUTES ====================
+declare_index("student_network_db", "users", [("email", 1)], unique=True)
+
 @app.route('/signup', methods=['POST'])
 def signup():
     try:
@@ -175,7 +1387,7 @@ def signup():
         }
 
         result = users_collection.insert_one(user)
-        print(f"✅ User created: {email} | ID: {result.inserted_id}")
+        log.info(f"User created: {email} | ID: {result.inserted_id}")
 
         return jsonify({
             'success': True,
@@ -193,12 +1405,13 @@ def signup():
                 'bio': user['bio']
             }
         }), 200
+    except PasswordHasherBusy:
+        return hasher_busy_response()
     except RuntimeError as runtime_err:
-        print(f"❌ Signup runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Signup runtime error (DB unavailable): {runtime_err}")
         return jsonify({'error': 'Database is unavailable'}), 503
     except Exception as e:
-        print(f"❌ Signup error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Signup error: {e}")
         return jsonify({'error': 'Failed to create account'}), 500
 
 
@@ -213,7 +1426,10 @@ def login_api():
         if not email or not password:
             return jsonify({'error': 'Email and password required'}), 400
 
-        user = users_collection.find_one({"email": email})
+        user = users_collection.find_one({"email": email}, {
+            "password": 1, "email": 1, "fullName": 1, "university": 1, "branch": 1,
+            "academicYear": 1, "skills": 1, "profilePhotoUrl": 1, "coverPhotoUrl": 1, "bio": 1
+        })
 
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -221,6 +1437,12 @@ def login_api():
         if not check_password(password, user['password']):
             return jsonify({'error': 'Incorrect password'}), 401
 
+        if password_hasher.needs_rehash(user['password']):
+            try:
+                users_collection.update_one({"_id": user["_id"]}, {"$set": {"password": hash_password(password)}})
+            except PasswordHasherBusy:
+                pass  # the old hash still verifies; upgrade on a later login
+
         user_data = {
             "id": str(user.get('_id', '')),
             "email": user.get('email', ''),
@@ -234,18 +1456,99 @@ def login_api():
             "bio": user.get('bio', '')
         }
 
-        print(f"✅ User logged in: {email}")
-        return jsonify({'success': True, 'user': user_data}), 200
+        log.info(f"User logged in: {email}")
+        return jsonify({'success': True, 'user': user_data, 'token': issue_session_token(user_data['id'])}), 200
+    except PasswordHasherBusy:
+        return hasher_busy_response()
     except RuntimeError as runtime_err:
-        print(f"❌ Login runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Login runtime error (DB unavailable): {runtime_err}")
         return jsonify({'error': 'Database is unavailable'}), 503
     except Exception as e:
-        print(f"❌ Login error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Login error: {e}")
         return jsonify({'error': 'Login failed'}), 500
 
 
 # ==================== PROFILE ROUTES ====================
+# Legacy users may be keyed by a string _id or carry a separate id field.
+# Until `flask normalize-user-ids` has run (then set USER_IDS_NORMALIZED=1),
+# one $or query covers every form instead of three sequential lookups.
+declare_index("student_network_db", "users", [("id", 1)], sparse=True)
+USER_IDS_NORMALIZED = os.environ.get("USER_IDS_NORMALIZED", "0") == "1"
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60))
+# Shared through CACHE_REDIS_URL; otherwise per-process, so another worker may serve an edited profile for up to USER_CACHE_TTL
+user_cache = make_cache_backend("users", int(os.environ.get("USER_CACHE_SIZE", 5000)))
+USER_PROFILE_PROJECTION = {
+    "id": 1, "email": 1, "fullName": 1, "university": 1, "branch": 1, "academicYear": 1,
+    "skills": 1, "profilePhotoUrl": 1, "coverPhotoUrl": 1, "bio": 1
+}
+
+
+def user_id_query(user_id):
+    if USER_IDS_NORMALIZED:
+        return {"_id": ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id}
+    clauses = [{"_id": user_id}, {"id": user_id}]
+    if ObjectId.is_valid(user_id):
+        clauses.insert(0, {"_id": ObjectId(user_id)})
+    return {"$or": clauses}
+
+
+def format_user_profile(user, user_id):
+    return {
+        "id": str(user.get('_id', user.get('id', user_id))),
+        "email": user.get('email', ''),
+        "fullName": user.get('fullName', ''),
+        "university": user.get('university', ''),
+        "branch": user.get('branch', ''),
+        "academicYear": user.get('academicYear', ''),
+        "skills": user.get('skills', []),
+        "profilePhotoUrl": user.get('profilePhotoUrl', ''),
+        "coverPhotoUrl": user.get('coverPhotoUrl', ''),
+        "bio": user.get('bio', '')
+    }
+
+
+def resolve_user(users_collection, user_id):
+    """Profile for user_id from the user cache, else one lookup; None if there is no such user"""
+    profile = user_cache.get(user_id)
+    if profile is None:
+        user = users_collection.find_one(user_id_query(user_id), USER_PROFILE_PROJECTION)
+        if user is None:
+            return None
+        profile = format_user_profile(user, user_id)
+        user_cache.set(user_id, profile, USER_CACHE_TTL)
+    return profile
+
+
+def forget_user(*user_ids):
+    for user_id in user_ids:
+        user_cache.delete(user_id)
+
+
+def resolve_users(users_collection, user_ids):
+    """{requested id: profile} for the ids that exist; cache misses are fetched with one $in query"""
+    found = {}
+    missing = []
+    for user_id in user_ids:
+        profile = user_cache.get(user_id)
+        if profile is None:
+            missing.append(user_id)
+        else:
+            found[user_id] = profile
+    if not missing:
+        return found
+
+    object_ids = [ObjectId(u) for u in missing if ObjectId.is_valid(u)]
+    if USER_IDS_NORMALIZED:
+        query = {"_id": {"$in": object_ids}}
+    else:
+        query = {"$or": [{"_id": {"$in": object_ids + missing}}, {"id": {"$in": missing}}]}
+    wanted = set(missing)
+    for user in users_collection.find(query, USER_PROFILE_PROJECTION):
+        for alias in {str(user["_id"]), str(user.get("id") or "")} & wanted:
+            found[alias] = format_user_profile(user, alias)
+            user_cache.set(alias, found[alias], USER_CACHE_TTL)
+    return found
+
 @app.route("/updateprofile", methods=["POST"])
 def update_profile():
     try:
@@ -259,105 +1562,215 @@ def update_profile():
 
         result = users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
         if result.matched_count > 0:
-            print(f"✅ Profile updated: {user_id}")
+            invalidate_cache(f"user:{user_id}")
+            forget_user(user_id)
+            log.info(f"Profile updated: {user_id}")
             return jsonify({"success": True}), 200
         else:
             return jsonify({"error": "User not found"}), 404
     except RuntimeError as runtime_err:
-        print(f"❌ Update profile runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Update profile runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database is unavailable"}), 503
     except Exception as e:
-        print(f"❌ Update profile error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Update profile error: {e}")
         return jsonify({"error": "Failed to update"}), 500
 
 
 @app.route("/getuser/<user_id>", methods=["GET"])
+@cached_response(lambda user_id: f"user:{user_id}")
 def get_user(user_id):
     try:
         users_collection = get_collection_safe(student_db, "users")
-        print(f"🔍 Attempting to fetch user: {user_id}")
+        user_data = resolve_user(users_collection, user_id)
+        if not user_data:
+            log.info(f"User not found: {user_id}")
+            return jsonify({"success": False, "error": "User not found"}), 404
 
-        user = None
-        try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-            if user:
-                print(f"✅ Found user by ObjectId")
-        except Exception:
-            pass
+        log.info(f"Retrieved user: {user_data['fullName']} (ID: {user_data['id']})")
+        return jsonify({"success": True, "user": user_data}), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Get user runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"success": False, "error": "Database is unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Get user error: {e}")
+        return jsonify({"success": False, "error": f"Failed to get user: {str(e)}"}), 500
 
-        if not user:
-            try:
-                user = users_collection.find_one({"_id": user_id})
-                if user:
-                    print(f"✅ Found user by string _id")
-            except Exception:
-                pass
 
-        if not user:
-            user = users_collection.find_one({"id": user_id})
-            if user:
-                print(f"✅ Found user by id field")
+USERS_BATCH_MAX = 100
+PUBLIC_USER_FIELDS = ("id", "fullName", "profilePhotoUrl", "branch", "university")
 
-        if not user:
-            print(f"❌ User not found: {user_id}")
-            return jsonify({"success": False, "error": "User not found"}), 404
 
-        user_data = {
-            "id": str(user.get('_id', user.get('id', user_id))),
-            "email": user.get('email', ''),
-            "fullName": user.get('fullName', ''),
-            "university": user.get('university', ''),
-            "branch": user.get('branch', ''),
-            "academicYear": user.get('academicYear', ''),
-            "skills": user.get('skills', []),
-            "profilePhotoUrl": user.get('profilePhotoUrl', ''),
-            "coverPhotoUrl": user.get('coverPhotoUrl', ''),
-            "bio": user.get('bio', '')
-        }
+@app.route("/getusers", methods=["GET"])
+def get_users():
+    """Public profile fields for ?ids=a,b,c in request order, with an ETag for revalidation"""
+    try:
+        user_ids = list(dict.fromkeys(u for u in request.args.get("ids", "").split(",") if u))
+        if not user_ids:
+            return jsonify({"success": False, "error": "ids required"}), 400
+        if len(user_ids) > USERS_BATCH_MAX:
+            return jsonify({"success": False, "error": f"At most {USERS_BATCH_MAX} ids per request"}), 400
 
-        print(f"✅ Retrieved user: {user_data['fullName']} (ID: {user_data['id']})")
-        return jsonify({"success": True, "user": user_data}), 200
+        users_collection = get_collection_safe(student_db, "users")
+        profiles = resolve_users(users_collection, user_ids)
+        users = [{k: profiles[u][k] for k in PUBLIC_USER_FIELDS} for u in user_ids if u in profiles]
+        missing = [u for u in user_ids if u not in profiles]
+
+        log.info(f"Retrieved {len(users)} of {len(user_ids)} users")
+        response = jsonify({"success": True, "users": users, "missing": missing})
+        response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:16])
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response.make_conditional(request)
     except RuntimeError as runtime_err:
-        print(f"❌ Get user runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get users runtime error (DB unavailable): {runtime_err}")
         return jsonify({"success": False, "error": "Database is unavailable"}), 503
     except Exception as e:
-        print(f"❌ Get user error: {e}")
-        traceback.print_exc(limit=1)
-        return jsonify({"success": False, "error": f"Failed to get user: {str(e)}"}), 500
+        log.exception(f"Get users error: {e}")
+        return jsonify({"success": False, "error": "Failed to get users"}), 500
 
 
 # ==================== GROUP ROUTES ====================
+declare_index("student_network_db", "groups", [("createdAt", -1), ("_id", -1)])
+declare_index("student_network_db", "groups", [("members", 1)])
+
+# Membership changes are single conditional updates: the filter carries every
+# precondition (leader, pending, not yet a member, room left) and the update
+# recomputes memberCount from the new members array, so concurrent joins and
+# accepts can never overfill a group. Groups created before memberCount
+# existed fall back to the size of their members array. Only an explicit
+# null maxMembers means uncapped; a group from before maxMembers was stored
+# gets it derived from preferred_team_size on its first membership update
+# (`flask backfill-max-members` does all of them at once).
+MEMBER_COUNT_EXPR = {"$ifNull": ["$memberCount", {"$size": {"$ifNull": ["$members", []]}}]}
+GROUP_HAS_ROOM = {"$or": [
+    {"maxMembers": {"$type": "null"}},
+    {"$expr": {"$lt": [MEMBER_COUNT_EXPR, "$maxMembers"]}}
+]}
+
+
+def id_forms(value):
+    return [value, ObjectId(value)] if ObjectId.is_valid(value) else [value]
+
+
+def without_member(field, user_id):
+    return {"$filter": {
+        "input": {"$ifNull": [f"${field}", []]},
+        "cond": {"$not": [{"$in": ["$$this", {"$literal": id_forms(user_id)}]}]}
+    }}
+
+
+def store_missing_cap(groups_collection, group_id):
+    """Derive and store maxMembers for a legacy group that lacks it; True if one was stored"""
+    group = groups_collection.find_one(
+        {"_id": ObjectId(group_id), "maxMembers": {"$exists": False}}, {"preferred_team_size": 1}
+    )
+    if not group:
+        return False
+    groups_collection.update_one(
+        {"_id": group["_id"], "maxMembers": {"$exists": False}},
+        {"$set": {"maxMembers": parse_team_size(group.get("preferred_team_size"))}}
+    )
+    return True
+
+
+def update_group_with_room(groups_collection, group_id, conditions, update, projection):
+    """Apply a membership update only if conditions hold and the group has room; None if it did not match"""
+    query = {"$and": [conditions, GROUP_HAS_ROOM]}
+    group = groups_collection.find_one_and_update(query, update, projection=projection)
+    if group is None and store_missing_cap(groups_collection, group_id):
+        group = groups_collection.find_one_and_update(query, update, projection=projection)
+    return group
+
+
+def membership_update(add_member=None, remove_member=None, remove_pending=None, add_pending=None):
+    """Update pipeline applying one membership transition and refreshing memberCount"""
+    changes = {}
+    if add_member:
+        changes["members"] = {"$concatArrays": [{"$ifNull": ["$members", []]}, [{"$literal": add_member}]]}
+    if remove_member:
+        changes["members"] = without_member("members", remove_member)
+    if add_pending:
+        changes["pendingMembers"] = {"$concatArrays": [{"$ifNull": ["$pendingMembers", []]}, [{"$literal": add_pending}]]}
+    if remove_pending:
+        changes["pendingMembers"] = without_member("pendingMembers", remove_pending)
+    return [{"$set": changes}, {"$set": {"memberCount": {"$size": {"$ifNull": ["$members", []]}}}}]
+
+
+def membership_conflict(groups_collection, group_id, user_id, leader_id=None):
+    """Explain why a conditional membership update matched nothing (only read on the failure path)"""
+    group = groups_collection.find_one({"_id": ObjectId(group_id)}, {
+        "creatoruserid": 1, "members": 1, "pendingMembers": 1
+    })
+    if not group:
+        return jsonify({"error": "Group not found"}), 404
+    if leader_id is not None and str(group.get("creatoruserid")) != leader_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    if user_id in [str(m) for m in group.get("members", [])]:
+        return jsonify({"error": "Already a member"}), 400
+    pending = [str(p) for p in group.get("pendingMembers", [])]
+    if leader_id is None and user_id in pending:
+        return jsonify({"error": "Request already sent"}), 400
+    if leader_id is not None and user_id not in pending:
+        return jsonify({"error": "No pending request from this user"}), 400
+    return jsonify({"error": "Group is full"}), 409
+
+
 @app.route('/getavailablegroups', methods=['GET', 'POST'])
+@cached_response("groups")
 def get_groups():
     try:
         groups_collection = get_collection_safe(student_db, "groups")
-        if request.method == 'POST' and request.json:
-            data = request.get_json()
-            userid = str(data.get('userId', ''))
-        else:
-            userid = str(request.args.get('userId', ''))
+        params = request.args.to_dict()
+        if request.method == 'POST':
+            params.update(request.get_json(silent=True) or {})
+        userid = str(params.get('userId') or '')
+
+        try:
+            limit = min(100, max(1, int(params.get('limit', 50))))
+        except (TypeError, ValueError):
+            return jsonify(error="limit must be an integer"), 400
+        skills = params.get('skills') or []
+        if isinstance(skills, str):
+            skills = [s.strip() for s in skills.split(',') if s.strip()]
+
+        query = {}
+        filters = []
+        if skills:
+            # Typed into the search box, so matched whole but case-insensitively
+            query['required_skills'] = {'$in': [re.compile(f"^{re.escape(s)}$", re.IGNORECASE) for s in skills]}
+        if userid and parse_bool_arg(params.get('memberOnly', False)):
+            query['members'] = {'$in': id_forms(userid)}
+        elif userid and parse_bool_arg(params.get('notMember', False)):
+            query['members'] = {'$nin': id_forms(userid)}
+        if parse_bool_arg(params.get('notFull', False)):
+            filters.append(GROUP_HAS_ROOM)
+        if params.get('cursor'):
+            try:
+                created_at, last_id = decode_cursor(params['cursor'])
+            except ValueError as cursor_err:
+                return jsonify(error=str(cursor_err)), 400
+            filters.append(keyset_filter('createdAt', created_at, last_id))
+        if filters:
+            query['$and'] = filters
+
+        projection = {
+            'creatoruserid': 1, 'members': 1, 'maxMembers': 1, 'preferred_team_size': 1,
+            'project_name': 1, 'description_objective': 1, 'project_timeline': 1,
+            'required_skills': 1, 'createdAt': 1
+        }
+        groups = list(
+            groups_collection.find(query, projection)
+            .sort([('createdAt', -1), ('_id', -1)])
+            .limit(limit + 1)
+        )
+        has_more = len(groups) > limit
+        groups = groups[:limit]
 
-        groups = list(groups_collection.find().sort('createdAt', -1))
         groupslist = []
         for group in groups:
-            members = group.get('members', [])
-            members = [str(m) for m in members]
+            members = [str(m) for m in group.get('members', [])]
             preferredteamsize = group.get('preferred_team_size')
-            maxsize = None
-            if preferredteamsize:
-                match = re.search(r'(\d+)', str(preferredteamsize))
-                if match:
-                    maxsize = int(match.group(1))
-                else:
-                    try:
-                        maxsize = int(preferredteamsize)
-                    except:
-                        maxsize = None
-
-            isfull = False
-            if maxsize and len(members) >= maxsize:
-                isfull = True
+            maxsize = group['maxMembers'] if 'maxMembers' in group else parse_team_size(preferredteamsize)
+            isfull = bool(maxsize and len(members) >= maxsize)
             ismember = userid in members if userid else False
             projectname = group.get('project_name')
             if not projectname or not str(projectname).strip():
@@ -378,12 +1791,17 @@ def get_groups():
                 "requiredskills": group.get('required_skills', []),
                 "createdAt": str(group.get('createdAt', datetime.utcnow()).isoformat())
             })
-        return jsonify(success=True, groups=groupslist), 200
+
+        next_cursor = None
+        if has_more and groups:
+            # Rows without createdAt sort last; keyset_filter reaches them after the dated rows
+            next_cursor = encode_cursor(groups[-1].get('createdAt'), groups[-1]['_id'])
+        return jsonify(success=True, groups=groupslist, nextCursor=next_cursor), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Get groups runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get groups runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        traceback.print_exc(limit=1)
+        log.exception(f"Get groups error: {e}")
         return jsonify(error="Could not load groups", details=str(e)), 500
 
 
@@ -393,7 +1811,7 @@ def create_group():
         groups_collection = get_collection_safe(student_db, "groups")
         data = request.get_json()
 
-        print(f"📝 Received group creation request: {data}")
+        log.debug(f"Group creation request from {data.get('userId') if isinstance(data, dict) else None}")
 
         if not data.get("project_name"):
             return jsonify({"error": "Project name required"}), 400
@@ -404,21 +1822,23 @@ def create_group():
             "project_name": data.get("project_name"),
             "description_objective": data.get("description_objective", ""),
             "preferred_team_size": data.get("preferred_team_size", ""),
+            "maxMembers": parse_team_size(data.get("preferred_team_size")),
             "required_skills": data.get("required_skills", []),
             "project_timeline": data.get("project_timeline", ""),
             "members": [creator_id],
+            "memberCount": 1,
             "pendingMembers": [],
             "createdAt": datetime.utcnow()
         }
         result = groups_collection.insert_one(group)
-        print(f"✅ Group created: {group['project_name']} | ID: {result.inserted_id}")
+        invalidate_cache("groups")
+        log.info(f"Group created: {group['project_name']} | ID: {result.inserted_id}")
         return jsonify({"success": True, "message": "Group created successfully!", "groupId": str(result.inserted_id)}), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Create group runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Create group runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Create group error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Create group error: {e}")
         return jsonify({"error": f"Failed to create group: {str(e)}"}), 500
 
 
@@ -435,31 +1855,22 @@ def join_group_api():
         if not user_id or not group_id:
             return jsonify({"error": "User ID and Group ID required"}), 400
 
-        print(f"🔍 Join group request - User: {user_id}, Group: {group_id}")
+        log.debug(f"Join group request - User: {user_id}, Group: {group_id}")
 
-        group = groups_collection.find_one({"_id": ObjectId(group_id)})
-        if not group:
-            return jsonify({"error": "Group not found"}), 404
-
-        # Already in group?
-        members = [str(m) for m in group.get("members", [])]
-        if user_id in members:
-            return jsonify({"error": "Already a member"}), 400
-
-        # Already pending?
-        pending = [str(p) for p in group.get("pendingMembers", [])]
-        if user_id in pending:
-            return jsonify({"error": "Request already sent"}), 400
-
-        # Add to pending list
-        groups_collection.update_one(
-            {"_id": ObjectId(group_id)},
-            {"$addToSet": {"pendingMembers": user_id}}
+        # Queue the request only if not already a member or pending and the group has room
+        group = update_group_with_room(
+            groups_collection, group_id,
+            {"_id": ObjectId(group_id), "members": {"$nin": id_forms(user_id)}, "pendingMembers": {"$nin": id_forms(user_id)}},
+            membership_update(add_pending=user_id),
+            projection={"creatoruserid": 1, "project_name": 1}
         )
+        if not group:
+            return membership_conflict(groups_collection, group_id, user_id)
+        invalidate_cache("groups")
 
         # Get user name
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
-        user_name = user.get("fullName", "Someone") if user else "Someone"
+        user = resolve_user(users_collection, user_id)
+        user_name = user.get("fullName") or "Someone" if user else "Someone"
 
         # Send notification to group leader
         leader_id = str(group.get("creatoruserid"))
@@ -471,11 +1882,14 @@ def join_group_api():
             f"{user_name} wants to join your group '{group.get('project_name', 'your group')}'"
         )
 
-        print(f"✅ User {user_id} sent join request to group {group_id}")
+        log.info(f"User {user_id} sent join request to group {group_id}")
         return jsonify({"success": True, "message": "Join request sent! Waiting for approval."}), 200
 
+    except RuntimeError as runtime_err:
+        log.error(f"Join group runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Join group error: {e}")
+        log.exception(f"Join group error: {e}")
         return jsonify({"error": f"Failed to join group: {str(e)}"}), 500
 
 
@@ -490,58 +1904,57 @@ def leave_group_api():
         if not user_id or not group_id:
             return jsonify({"error": "User ID and Group ID required"}), 400
 
-        print(f"🔍 Leave group - User: {user_id}, Group: {group_id}")
+        log.debug(f"Leave group - User: {user_id}, Group: {group_id}")
 
-        group = groups_collection.find_one({"_id": ObjectId(group_id)})
-        if not group:
-            return jsonify({"error": "Group not found"}), 404
-
-        result = groups_collection.update_one({"_id": ObjectId(group_id)}, {"$pull": {"members": str(user_id)}})
-        if result.matched_count > 0:
-            print(f"✅ User {user_id} left group {group_id}")
+        result = groups_collection.update_one(
+            {"_id": ObjectId(group_id), "members": {"$in": id_forms(user_id)}},
+            membership_update(remove_member=user_id)
+        )
+        # Leaving a group you are not in still succeeds, as long as the group exists
+        if result.matched_count > 0 or groups_collection.count_documents({"_id": ObjectId(group_id)}, limit=1):
+            invalidate_cache("groups")
+            log.info(f"User {user_id} left group {group_id}")
             return jsonify({"success": True, "message": "Left group successfully!"}), 200
         else:
             return jsonify({"error": "Group not found"}), 404
     except RuntimeError as runtime_err:
-        print(f"❌ Leave group runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Leave group runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Leave group error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Leave group error: {e}")
         return jsonify({"error": f"Failed to leave group: {str(e)}"}), 500
 
 
 @app.route("/acceptjoinrequest", methods=["POST"])
+@with_session
 def accept_join_request():
     try:
         groups_collection = get_collection_safe(student_db, "groups")
         notifications_collection = get_collection_safe(student_db, "notifications")
-        users_collection = get_collection_safe(student_db, "users")
 
         data = request.get_json()
         group_id = data.get("groupId")
         user_id_to_accept = str(data.get("userId"))
-        leader_id = str(data.get("leaderId"))
+        leader_id = session_user_id(data.get("leaderId"))
 
         if not all([group_id, user_id_to_accept, leader_id]):
             return jsonify({"error": "Group ID, User ID, Leader ID required"}), 400
 
-        group = groups_collection.find_one({"_id": ObjectId(group_id)})
-        if not group:
-            return jsonify({"error": "Group not found"}), 404
-
-        # Only leader can accept
-        if str(group.get("creatoruserid")) != leader_id:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Move user from pending → members
-        groups_collection.update_one(
-            {"_id": ObjectId(group_id)},
+        # Move user from pending → members, only for the leader, a pending user and a group with room
+        group = update_group_with_room(
+            groups_collection, group_id,
             {
-                "$pull": {"pendingMembers": user_id_to_accept},
-                "$addToSet": {"members": user_id_to_accept}
-            }
+                "_id": ObjectId(group_id),
+                "creatoruserid": {"$in": id_forms(leader_id)},
+                "pendingMembers": {"$in": id_forms(user_id_to_accept)},
+                "members": {"$nin": id_forms(user_id_to_accept)}
+            },
+            membership_update(add_member=user_id_to_accept, remove_pending=user_id_to_accept),
+            projection={"project_name": 1}
         )
+        if not group:
+            return membership_conflict(groups_collection, group_id, user_id_to_accept, leader_id)
+        invalidate_cache("groups")
 
         # Notify accepted user
         create_notification(
@@ -553,21 +1966,23 @@ def accept_join_request():
         )
 
         # Mark join_request notifications as read
-        notifications_collection.update_many(
-            {"groupId": str(group_id), "fromUserId": user_id_to_accept, "type": "join_request"},
-            {"$set": {"isRead": True}}
-        )
+        mark_notifications_read(notifications_collection, {
+            "userId": leader_id, "groupId": str(group_id), "fromUserId": user_id_to_accept, "type": "join_request"
+        })
 
-        print(f"✅ User {user_id_to_accept} accepted into group {group_id}")
+        log.info(f"User {user_id_to_accept} accepted into group {group_id}")
         return jsonify({"success": True, "message": "User accepted!"}), 200
 
+    except RuntimeError as runtime_err:
+        log.error(f"Accept join request runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Accept join request error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Accept join request error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/rejectjoinrequest", methods=["POST"])
+@with_session
 def reject_join_request():
     try:
         groups_collection = get_collection_safe(student_db, "groups")
@@ -576,34 +1991,37 @@ def reject_join_request():
         data = request.get_json()
         group_id = data.get("groupId")
         user_id_to_reject = str(data.get("userId"))
-        leader_id = str(data.get("leaderId"))
+        leader_id = session_user_id(data.get("leaderId"))
 
         if not all([group_id, user_id_to_reject, leader_id]):
             return jsonify({"error": "Group ID, User ID, Leader ID required"}), 400
 
-        group = groups_collection.find_one({"_id": ObjectId(group_id)})
-        if not group:
-            return jsonify({"error": "Group not found"}), 404
-
-        if str(group.get("creatoruserid")) != leader_id:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        groups_collection.update_one(
-            {"_id": ObjectId(group_id)},
-            {"$pull": {"pendingMembers": user_id_to_reject}}
+        result = groups_collection.update_one(
+            {"_id": ObjectId(group_id), "creatoruserid": {"$in": id_forms(leader_id)}, "pendingMembers": {"$in": id_forms(user_id_to_reject)}},
+            membership_update(remove_pending=user_id_to_reject)
         )
+        if result.matched_count == 0:
+            # Not pending any more is fine (the request is still cleared below); a wrong group or leader is not
+            group = groups_collection.find_one({"_id": ObjectId(group_id)}, {"creatoruserid": 1})
+            if not group:
+                return jsonify({"error": "Group not found"}), 404
+            if str(group.get("creatoruserid")) != leader_id:
+                return jsonify({"error": "Unauthorized"}), 403
+        else:
+            invalidate_cache("groups")
 
-        notifications_collection.update_many(
-            {"groupId": str(group_id), "fromUserId": user_id_to_reject, "type": "join_request"},
-            {"$set": {"isRead": True}}
-        )
+        mark_notifications_read(notifications_collection, {
+            "userId": leader_id, "groupId": str(group_id), "fromUserId": user_id_to_reject, "type": "join_request"
+        })
 
-        print(f"✅ Join request from {user_id_to_reject} rejected for group {group_id}")
+        log.info(f"Join request from {user_id_to_reject} rejected for group {group_id}")
         return jsonify({"success": True, "message": "Request rejected"}), 200
 
+    except RuntimeError as runtime_err:
+        log.error(f"Reject join request runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Reject join request error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Reject join request error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -617,73 +2035,499 @@ def get_my_groups():
 
         my_groups = list(groups_collection.find({'members': user_id}, {'_id': 1, 'project_name': 1}))
         groups_list = [{"groupId": str(g['_id']), "groupName": g.get("project_name", "Unnamed Group")} for g in my_groups]
-        print(f"✅ Retrieved {len(groups_list)} groups for user {user_id}")
+        log.info(f"Retrieved {len(groups_list)} groups for user {user_id}")
         return jsonify({"success": True, "groups": groups_list}), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Get my groups runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get my groups runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Get my groups error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Get my groups error: {e}")
         return jsonify({"error": "Could not load user's groups"}), 500
 
 
 # ==================== POSTS ROUTES ====================
+# Feed: create_post() pushes the post id onto the capped timeline of everyone
+# in its audience (group co-members, same university + branch). Authors whose
+# audience exceeds FEED_FANOUT_MAX_AUDIENCE are fanned out on read instead:
+# their posts carry audienceKeys and are merged into each reader's page.
+FEED_TIMELINE_LENGTH = int(os.environ.get("FEED_TIMELINE_LENGTH", 500))
+FEED_FANOUT_MAX_AUDIENCE = int(os.environ.get("FEED_FANOUT_MAX_AUDIENCE", 2000))
+
+declare_index(
+    "student_network_db", "posts", [("audienceKeys", 1), ("_id", -1)],
+    partialFilterExpression={"fanoutOnRead": True}
+)
+declare_index("student_network_db", "timelines", [("userId", 1)], unique=True)
+declare_index("student_network_db", "post_likes", [("postId", 1), ("userId", 1)], unique=True)
+declare_index("student_network_db", "post_likes", [("userId", 1), ("postId", 1)])
+declare_index("student_network_db", "post_comments", [("postId", 1), ("_id", -1)])
+
+# Feed rows carry counters only; likers live in post_likes and comments in post_comments.
+# Posts written before the counters existed fall back to the size of their legacy arrays,
+# and the first counter update on such a post seeds the counter from that size.
+LIKE_COUNT_EXPR = {"$ifNull": ["$likeCount", {"$size": {"$ifNull": ["$likes", []]}}]}
+COMMENT_COUNT_EXPR = {"$ifNull": ["$commentCount", {"$size": {"$ifNull": ["$comments", []]}}]}
+POST_PROJECTION = {
+    "userId": 1, "userName": 1, "userPhoto": 1, "content": 1, "imageUrl": 1, "createdAt": 1,
+    "likeCount": LIKE_COUNT_EXPR,
+    "commentCount": COMMENT_COUNT_EXPR
+}
+declare_index("student_network_db", "users", [("university", 1), ("branch", 1)])
+
+
+def audience_keys(user, group_ids):
+    keys = [f"group:{group_id}" for group_id in group_ids]
+    if user and user.get("university") and user.get("branch"):
+        keys.append(f"campus:{user['university']}|{user['branch']}")
+    return keys
+
+
+def post_audience(author_id):
+    """Return (audience keys, reader ids or None when the audience is too large to fan out)"""
+    users_collection = get_collection_safe(student_db, "users")
+    groups_collection = get_collection_safe(student_db, "groups")
+    author = fetch_by_ids(users_collection, [author_id], {"university": 1, "branch": 1}).get(str(author_id))
+    groups = list(groups_collection.find({"members": str(author_id)}, {"members": 1}))
+
+    readers = {str(author_id)}
+    for group in groups:
+        readers.update(str(m) for m in group.get("members", []))
+    if author and author.get("university") and author.get("branch"):
+        campus = users_collection.find(
+            {"university": author["university"], "branch": author["branch"]}, {"_id": 1}
+        ).limit(FEED_FANOUT_MAX_AUDIENCE + 1)
+        readers.update(str(u["_id"]) for u in campus)
+
+    keys = audience_keys(author, [str(group["_id"]) for group in groups])
+    if len(readers) > FEED_FANOUT_MAX_AUDIENCE:
+        return keys, None
+    return keys, readers
+
+
+# Fan-out runs off the request thread; threads start on first submit, so each gunicorn worker gets its own
+feed_fanout_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="feed-fanout")
+
+
+def distribute_post(post_id, author_id):
+    """Push a new post into its readers' timelines, or mark it fan-out-on-read for a large audience"""
+    try:
+        keys, readers = post_audience(author_id)
+        if readers is None:
+            posts_collection = get_collection_safe(student_db, "posts")
+            posts_collection.update_one({"_id": post_id}, {"$set": {"fanoutOnRead": True, "audienceKeys": keys}})
+        else:
+            fan_out_post(post_id, readers)
+        invalidate_cache("posts")
+    except Exception as e:
+        log.exception(f"Fan-out of post {post_id} failed: {e}")
+
+
+def fan_out_post(post_id, reader_ids):
+    timelines_collection = get_collection_safe(student_db, "timelines")
+    timelines_collection.bulk_write([
+        UpdateOne(
+            {"userId": reader_id},
+            {"$push": {"postIds": {"$each": [post_id], "$position": 0, "$slice": FEED_TIMELINE_LENGTH}}},
+            upsert=True
+        ) for reader_id in reader_ids
+    ], ordered=False)
+
+
+def read_timeline(user_id, before, limit):
+    """Post ids for one feed page, newest first: the precomputed timeline merged with fan-out-on-read posts"""
+    timelines_collection = get_collection_safe(student_db, "timelines")
+    posts_collection = get_collection_safe(student_db, "posts")
+    users_collection = get_collection_safe(student_db, "users")
+    groups_collection = get_collection_safe(student_db, "groups")
+
+    timeline = timelines_collection.find_one({"userId": user_id}, {"postIds": 1}) or {}
+    post_ids = [pid for pid in timeline.get("postIds", []) if before is None or pid < before]
+
+    user = fetch_by_ids(users_collection, [user_id], {"university": 1, "branch": 1}).get(user_id)
+    if g.get("session") and g.session["snapshotFresh"]:
+        group_ids = g.session["groups"]
+    else:
+        group_ids = [str(group["_id"]) for group in groups_collection.find({"members": user_id}, {"_id": 1})]
+    keys = audience_keys(user, group_ids)
+    if keys:
+        read_query = {"fanoutOnRead": True, "audienceKeys": {"$in": keys}}
+        if before is not None:
+            read_query["_id"] = {"$lt": before}
+        post_ids.extend(p["_id"] for p in posts_collection.find(read_query, {"_id": 1}).sort("_id", -1).limit(limit + 1))
+
+    stored_ids = timeline.get("postIds", [])
+    if stored_ids and len(post_ids) <= limit:
+        # Below the oldest timeline entry (posts from before fan-out, or trimmed off the cap)
+        # the feed continues with the global latest posts, as for a user without a timeline
+        floor = stored_ids[-1] if before is None or stored_ids[-1] < before else before
+        older = posts_collection.find({"_id": {"$lt": floor}}, {"_id": 1}).sort("_id", -1).limit(limit + 1)
+        post_ids.extend(p["_id"] for p in older)
+
+    return sorted(set(post_ids), reverse=True)[:limit + 1], bool(timeline)
+
+
+def format_post(p, liked_post_ids=()):
+    return {
+        "postId": str(p['_id']),
+        "userId": p.get("userId"),
+        "userName": p.get("userName"),
+        "userPhoto": p.get("userPhoto", ""),
+        "content": p.get("content", ""),
+        "imageUrl": p.get("imageUrl", ""),
+        "likeCount": int(p.get("likeCount", 0)),
+        "commentCount": int(p.get("commentCount", 0)),
+        "likedByMe": p['_id'] in liked_post_ids,
+        "createdAt": p.get("createdAt", datetime.utcnow()).isoformat()
+    }
+
+
+def liked_post_ids(user_id, post_ids):
+    """Which of post_ids the user has liked, in one indexed query"""
+    if not user_id or not post_ids:
+        return set()
+    likes_collection = get_collection_safe(student_db, "post_likes")
+    likes = likes_collection.find({"userId": str(user_id), "postId": {"$in": list(post_ids)}}, {"postId": 1, "_id": 0})
+    return {like["postId"] for like in likes}
+
+
 @app.route("/createpost", methods=["POST"])
 def create_post():
     try:
         posts_collection = get_collection_safe(student_db, "posts")
         data = request.get_json()
+        author_id = str(data.get("userId")) if data.get("userId") else None
         post = {
             "userId": data.get("userId"),
             "userName": data.get("userName"),
             "userPhoto": data.get("userPhoto", ""),
             "content": data.get("content", ""),
             "imageUrl": data.get("imageUrl", ""),
-            "likes": [],
-            "comments": [],
+            "likeCount": 0,
+            "commentCount": 0,
             "createdAt": datetime.utcnow()
         }
         result = posts_collection.insert_one(post)
-        print(f"✅ Post created by: {post['userName']} | ID: {result.inserted_id}")
+        if author_id:
+            feed_fanout_executor.submit(distribute_post, result.inserted_id, author_id)
+        invalidate_cache("posts")
+        log.info(f"Post created by: {post['userName']} | ID: {result.inserted_id}")
         return jsonify({"success": True, "message": "Post created successfully!", "postId": str(result.inserted_id)}), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Create post runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Create post runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Create post error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Create post error: {e}")
         return jsonify({"error": "Failed to create post"}), 500
 
 
+def session_feed_tag():
+    return f"feed:{g.session['uid']}" if g.get("session") else "feed:anonymous"
+
+
 @app.route("/getposts", methods=["GET"])
+@with_session
+@cached_response("posts", session_feed_tag)
 def get_posts():
     try:
         posts_collection = get_collection_safe(student_db, "posts")
-        posts = list(posts_collection.find({}).sort("createdAt", -1).limit(50))
-        posts_list = [{
-            "postId": str(p['_id']),
-            "userId": p.get("userId"),
-            "userName": p.get("userName"),
-            "userPhoto": p.get("userPhoto", ""),
-            "content": p.get("content", ""),
-            "imageUrl": p.get("imageUrl", ""),
-            "likes": p.get("likes", []),
-            "comments": p.get("comments", []),
-            "createdAt": p.get("createdAt", datetime.utcnow()).isoformat()
-        } for p in posts]
-        print(f"✅ Retrieved {len(posts_list)} posts")
-        return jsonify({"success": True, "posts": posts_list}), 200
+        user_id = request.args.get('userId')
+        try:
+            limit = min(100, max(1, int(request.args.get('limit', 50))))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+        try:
+            before = ObjectId(request.args['cursor']) if request.args.get('cursor') else None
+        except Exception:
+            return jsonify({"error": "cursor must be a post ID"}), 400
+
+        posts = None
+        if user_id:
+            user_id = session_user_id(user_id)
+            post_ids, has_timeline = read_timeline(user_id, before, limit)
+            if has_timeline or post_ids:
+                posts_by_id = fetch_by_ids(posts_collection, post_ids, POST_PROJECTION)
+                posts = [posts_by_id[str(pid)] for pid in post_ids if str(pid) in posts_by_id]
+        if posts is None:
+            # Anonymous readers and users without a timeline yet get the global latest posts
+            query = {"_id": {"$lt": before}} if before else {}
+            posts = list(posts_collection.find(query, POST_PROJECTION).sort("_id", -1).limit(limit + 1))
+
+        has_more = len(posts) > limit
+        posts = posts[:limit]
+        liked = liked_post_ids(user_id, [p['_id'] for p in posts])
+        posts_list = [format_post(p, liked) for p in posts]
+        next_cursor = posts_list[-1]["postId"] if has_more and posts_list else None
+        log.info(f"Retrieved {len(posts_list)} posts")
+        return jsonify({"success": True, "posts": posts_list, "nextCursor": next_cursor}), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Get posts runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get posts runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Get posts error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Get posts error: {e}")
         return jsonify({"error": "Could not load posts"}), 500
 
 
+@app.route("/likepost", methods=["POST"])
+@with_session
+def like_post():
+    try:
+        posts_collection = get_collection_safe(student_db, "posts")
+        likes_collection = get_collection_safe(student_db, "post_likes")
+        data = request.get_json() or {}
+        post_id = data.get("postId")
+        user_id = session_user_id(data.get("userId"))
+        if not post_id or not user_id or user_id == 'None':
+            return jsonify({"error": "Post ID and User ID required"}), 400
+
+        post_obj = ObjectId(post_id)
+        post = posts_collection.find_one({"_id": post_obj}, {"likes": {"$elemMatch": {"$eq": user_id}}})
+        if not post:
+            return jsonify({"error": "Post not found"}), 404
+        try:
+            likes_collection.insert_one({"postId": post_obj, "userId": user_id, "createdAt": datetime.utcnow()})
+        except DuplicateKeyError:
+            return jsonify({"success": True, "liked": True}), 200
+        if post.get("likes"):
+            # Already counted through the legacy likes array
+            return jsonify({"success": True, "liked": True}), 200
+
+        posts_collection.update_one({"_id": post_obj}, [{"$set": {"likeCount": {"$add": [LIKE_COUNT_EXPR, 1]}}}])
+        # Only the liker's own pages change shape (likedByMe); other readers catch up on counts within RESPONSE_CACHE_TTL
+        invalidate_cache(f"feed:{user_id}")
+        return jsonify({"success": True, "liked": True}), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Like post runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Like post error: {e}")
+        return jsonify({"error": "Failed to like post"}), 500
+
+
+@app.route("/unlikepost", methods=["POST"])
+@with_session
+def unlike_post():
+    try:
+        posts_collection = get_collection_safe(student_db, "posts")
+        likes_collection = get_collection_safe(student_db, "post_likes")
+        data = request.get_json() or {}
+        post_id = data.get("postId")
+        user_id = session_user_id(data.get("userId"))
+        if not post_id or not user_id or user_id == 'None':
+            return jsonify({"error": "Post ID and User ID required"}), 400
+
+        post_obj = ObjectId(post_id)
+        result = likes_collection.delete_one({"postId": post_obj, "userId": user_id})
+        unliked = {"likeCount": {"$max": [0, {"$subtract": [LIKE_COUNT_EXPR, 1]}]}}
+        # A like still in the legacy array is pulled from it too, or migrate-post-engagement would restore it
+        legacy = posts_collection.update_one({"_id": post_obj, "likes": user_id}, [{"$set": {
+            **unliked, "likes": {"$filter": {"input": "$likes", "cond": {"$ne": ["$$this", user_id]}}}
+        }}])
+        if result.deleted_count and not legacy.modified_count:
+            posts_collection.update_one({"_id": post_obj}, [{"$set": unliked}])
+        if result.deleted_count or legacy.modified_count:
+            invalidate_cache(f"feed:{user_id}")
+        return jsonify({"success": True, "liked": False}), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Unlike post runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Unlike post error: {e}")
+        return jsonify({"error": "Failed to unlike post"}), 500
+
+
+@app.route("/addcomment", methods=["POST"])
+@with_session
+def add_comment():
+    try:
+        posts_collection = get_collection_safe(student_db, "posts")
+        comments_collection = get_collection_safe(student_db, "post_comments")
+        data = request.get_json() or {}
+        post_id = data.get("postId")
+        user_id = session_user_id(data.get("userId"))
+        content = (data.get("content") or "").strip()
+        if not post_id or not user_id or user_id == 'None':
+            return jsonify({"error": "Post ID and User ID required"}), 400
+        if not content:
+            return jsonify({"error": "Comment cannot be empty"}), 400
+
+        post_obj = ObjectId(post_id)
+        result = posts_collection.update_one({"_id": post_obj}, [{"$set": {"commentCount": {"$add": [COMMENT_COUNT_EXPR, 1]}}}])
+        if result.matched_count == 0:
+            return jsonify({"error": "Post not found"}), 404
+        comment = {
+            "postId": post_obj,
+            "userId": user_id,
+            "userName": data.get("userName", "Anonymous"),
+            "userPhoto": data.get("userPhoto", ""),
+            "content": content,
+            "createdAt": datetime.utcnow()
+        }
+        inserted = comments_collection.insert_one(comment)
+        invalidate_cache(f"feed:{user_id}")
+        return jsonify({"success": True, "commentId": str(inserted.inserted_id)}), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Add comment runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Add comment error: {e}")
+        return jsonify({"error": "Failed to add comment"}), 500
+
+
+@app.route("/getcomments/<post_id>", methods=["GET"])
+def get_comments(post_id):
+    try:
+        comments_collection = get_collection_safe(student_db, "post_comments")
+        try:
+            limit = min(100, max(1, int(request.args.get('limit', 20))))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+        query = {"postId": ObjectId(post_id)}
+        if request.args.get('cursor'):
+            try:
+                query["_id"] = {"$lt": ObjectId(request.args['cursor'])}
+            except Exception:
+                return jsonify({"error": "cursor must be a comment ID"}), 400
+
+        comments = list(comments_collection.find(query).sort("_id", -1).limit(limit + 1))
+        has_more = len(comments) > limit
+        comments = comments[:limit]
+        comments_list = [{
+            "commentId": str(c['_id']),
+            "userId": c.get("userId"),
+            "userName": c.get("userName", "Anonymous"),
+            "userPhoto": c.get("userPhoto", ""),
+            "content": c.get("content", ""),
+            "createdAt": c.get("createdAt", datetime.utcnow()).isoformat()
+        } for c in comments]
+        return jsonify({
+            "success": True,
+            "comments": comments_list,
+            "nextCursor": comments_list[-1]["commentId"] if has_more else None
+        }), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Get comments runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Get comments error: {e}")
+        return jsonify({"error": "Could not load comments"}), 500
+
+
 # ==================== Q&A ROUTES ====================
+declare_index("student_network_db", "questions", [("votes", -1), ("_id", -1)])
+declare_index("student_network_db", "questions", [("createdAt", -1), ("_id", -1)])
+declare_index(
+    "student_network_db", "questions", [("title", "text"), ("content", "text"), ("tags", "text")],
+    name="questions_text", weights={"title": 10, "tags": 5, "content": 1}
+)
+declare_index("student_network_db", "questions", [("searchTerms", 1)])
+declare_index("student_network_db", "questions", [("tags", 1)])
+
+# Totals for the pagination widget, per filter/search; keyed by the "questions" tag version, so writes that bump it retire them
+QUESTION_COUNT_TTL = int(os.environ.get("QUESTION_COUNT_TTL", 30))
+
+
+def question_total(questions_collection, query, filter_type, search):
+    try:
+        version = cache_backend.versions(["questions"])[0]
+        key = f"question-count|{version}|{filter_type}|{search}"
+        total = cache_backend.get(key)
+    except Exception as e:
+        log.error(f"Question count cache lookup failed: {e}")
+        return questions_collection.count_documents(query)
+    if total is None:
+        total = questions_collection.count_documents(query)
+        try:
+            cache_backend.set(key, total, QUESTION_COUNT_TTL)
+        except Exception as e:
+            log.error(f"Question count cache store failed: {e}")
+    return total
+
+
+def _better_answer(candidate, current):
+    """Aggregation expression: accepted beats not accepted, then more votes wins"""
+    accepted = {"$ifNull": [f"{candidate}.accepted", False]}
+    current_accepted = {"$ifNull": [f"{current}.accepted", False]}
+    return {"$or": [
+        {"$eq": [current, None]},
+        {"$and": [accepted, {"$not": [current_accepted]}]},
+        {"$and": [
+            {"$eq": [accepted, current_accepted]},
+            {"$gt": [{"$ifNull": [f"{candidate}.votes", 0]}, {"$ifNull": [f"{current}.votes", 0]}]}
+        ]}
+    ]}
+
+
+# List view ships counts and a single preview answer; full threads come from /getanswers
+QUESTION_SUMMARY_PROJECTION = {
+    "userId": 1, "userName": 1, "userPhoto": 1, "title": 1, "content": 1,
+    "tags": 1, "votes": 1, "views": 1, "createdAt": 1,
+    "answerCount": {"$size": {"$ifNull": ["$answers", []]}},
+    "hasAcceptedAnswer": {"$in": [True, {"$ifNull": ["$answers.accepted", []]}]},
+    "topAnswer": {"$reduce": {
+        "input": {"$ifNull": ["$answers", []]},
+        "initialValue": None,
+        "in": {"$cond": [_better_answer("$$this", "$$value"), "$$this", "$$value"]}
+    }}
+}
+
+ANSWER_SORTS = {
+    "votes": {"answers.votes": -1, "answers.createdAt": 1},
+    "accepted": {"answers.accepted": -1, "answers.votes": -1, "answers.createdAt": 1},
+    "recent": {"answers.createdAt": -1}
+}
+
+
+def format_answer(answer):
+    return {
+        'answerId': answer.get('answerId', str(ObjectId())),
+        'userId': str(answer.get('userId', '')),
+        'userName': answer.get('userName', 'Anonymous'),
+        'userPhoto': answer.get('userPhoto', ''),
+        'content': answer.get('content', ''),
+        'votes': int(answer.get('votes', 0)),
+        'accepted': bool(answer.get('accepted', False)),
+        'createdAt': answer.get('createdAt', datetime.utcnow().isoformat())
+    }
+
+
+def tokenize(text):
+    return re.findall(r"[^\W_]+", str(text or "").lower())
+
+
+def question_search_terms(title, tags):
+    """Lowercased title/tag tokens stored on each question for indexed prefix lookups"""
+    terms = set(tokenize(title))
+    for tag in tags or []:
+        terms.update(tokenize(tag))
+    return sorted(terms)
+
+
+def build_question_search(search):
+    """Translate the search box into an index-backed query.
+
+    Returns (query, ranked): "#tag" matches the tag exactly; otherwise every
+    word goes through the text index (ranked by textScore), and a trailing
+    word still being typed also matches questions with a searchTerms entry
+    starting with it. A search with no words at all matches nothing.
+    """
+    search = search.strip()
+    if search.startswith('#') and len(search.split()) == 1:
+        tag = search[1:]
+        return {'tags': {'$in': list({tag, tag.lower()})}}, False
+
+    if not search:
+        return {}, False
+    tokens = tokenize(search)
+    if not tokens:
+        return {'_id': {'$in': []}}, False
+
+    text = {'$text': {'$search': " ".join(tokens)}}
+    if not search[-1].isalnum():
+        return text, True
+    # Both $or branches are indexed, which $text requires; prefix-only matches rank last
+    return {'$or': [text, {'searchTerms': {'$regex': '^' + re.escape(tokens[-1])}}]}, True
+
+
 @app.route("/createquestion", methods=["POST"])
 def create_question():
     try:
@@ -699,45 +2543,44 @@ def create_question():
             "title": data.get("title").strip(),
             "content": data.get("content", "").strip(),
             "tags": data.get("tags", []),
+            "searchTerms": question_search_terms(data.get("title"), data.get("tags", [])),
             "answers": [],
             "votes": 0,
             "views": 0,
             "createdAt": datetime.utcnow()
         }
         result = questions_collection.insert_one(question)
-        print(f"✅ Question created: {question['title'][:50]}... | ID: {result.inserted_id}")
+        invalidate_cache("questions")
+        log.info(f"Question created: {question['title'][:50]}... | ID: {result.inserted_id}")
         return jsonify({"success": True, "message": "Question posted successfully!", "questionId": str(result.inserted_id)}), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Create question runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Create question runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Create question error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Create question error: {e}")
         return jsonify({"error": f"Failed to create question: {str(e)}"}), 500
 
 
 @app.route("/getquestions", methods=["GET"])
+@cached_response("questions")
 def get_questions():
     try:
         questions_collection = get_collection_safe(student_db, "questions")
         filter_type = request.args.get('filter', 'all').lower()
         search = request.args.get('search', '').strip()
-        page = max(1, int(request.args.get('page', 1)))
-        limit = min(100, max(1, int(request.args.get('limit', 5))))
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+            limit = min(100, max(1, int(request.args.get('limit', 5))))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": "page and limit must be integers"}), 400
         skip = (page - 1) * limit
+        page_cursor = request.args.get('cursor')
 
-        print(f"📥 GET /getquestions - filter: {filter_type}, search: '{search}', page: {page}, limit: {limit}")
+        log.debug(f"GET /getquestions - filter: {filter_type}, search: '{search}', page: {page}, limit: {limit}")
 
-        query = {}
-        if search:
-            search_term = search.replace('#', '').strip()
-            query['$or'] = [
-                {'title': {'$regex': search_term, '$options': 'i'}},
-                {'content': {'$regex': search_term, '$options': 'i'}},
-                {'tags': {'$in': [search_term.lower()]}}
-            ]
+        query, ranked = build_question_search(search)
         if filter_type == 'unanswered':
-            query['$or'] = [{'answers': {'$exists': False}}, {'answers': {'$size': 0}}]
+            query = {'$and': [query, {'$or': [{'answers': {'$exists': False}}, {'answers': {'$size': 0}}]}]}
 
         if filter_type == 'most-voted':
             sort_field, sort_direction = "votes", -1
@@ -746,24 +2589,36 @@ def get_questions():
         else:
             sort_field, sort_direction = "createdAt", -1
 
-        cursor = questions_collection.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit)
-        questions = list(cursor)
-        total_count = questions_collection.count_documents(query)
+        total_count = question_total(questions_collection, query, filter_type, search)
+
+        if ranked:
+            # Relevance order has no stable key to seek on, so search results page by offset
+            cursor = questions_collection.find(query, {**QUESTION_SUMMARY_PROJECTION, 'score': {'$meta': 'textScore'}}).sort(
+                [('score', {'$meta': 'textScore'}), (sort_field, sort_direction)]
+            ).skip(skip)
+        elif page_cursor:
+            try:
+                last_value, last_id = decode_cursor(page_cursor)
+            except ValueError as cursor_err:
+                return jsonify({"success": False, "error": str(cursor_err)}), 400
+            keyset_query = {'$and': [query, keyset_filter(sort_field, last_value, last_id, sort_direction)]}
+            cursor = questions_collection.find(keyset_query, QUESTION_SUMMARY_PROJECTION).sort(
+                [(sort_field, sort_direction), ('_id', sort_direction)]
+            )
+        else:
+            cursor = questions_collection.find(query, QUESTION_SUMMARY_PROJECTION).sort(
+                [(sort_field, sort_direction), ('_id', sort_direction)]
+            ).skip(skip)
+        questions = list(cursor.limit(limit + 1))
+        has_more = len(questions) > limit
+        questions = questions[:limit]
+        next_cursor = None
+        if has_more and not ranked and sort_field in questions[-1]:
+            next_cursor = encode_cursor(questions[-1][sort_field], questions[-1]['_id'])
 
         questions_list = []
         for q in questions:
-            formatted_answers = []
-            for answer in q.get('answers', []):
-                formatted_answers.append({
-                    'answerId': answer.get('answerId', str(ObjectId())),
-                    'userId': str(answer.get('userId', '')),
-                    'userName': answer.get('userName', 'Anonymous'),
-                    'userPhoto': answer.get('userPhoto', ''),
-                    'content': answer.get('content', ''),
-                    'votes': int(answer.get('votes', 0)),
-                    'accepted': bool(answer.get('accepted', False)),
-                    'createdAt': answer.get('createdAt', datetime.utcnow().isoformat())
-                })
+            top_answer = q.get("topAnswer")
             questions_list.append({
                 "questionId": str(q['_id']),
                 "userId": str(q.get("userId", '')),
@@ -772,14 +2627,16 @@ def get_questions():
                 "title": q.get("title", "Untitled Question"),
                 "content": q.get("content", ""),
                 "tags": q.get("tags", []),
-                "answers": formatted_answers,
+                "answerCount": int(q.get("answerCount", 0)),
+                "hasAcceptedAnswer": bool(q.get("hasAcceptedAnswer", False)),
+                "topAnswer": format_answer(top_answer) if top_answer else None,
                 "votes": int(q.get("votes", 0)),
                 "views": int(q.get("views", 0)),
                 "createdAt": q.get("createdAt", datetime.utcnow()).isoformat()
             })
 
         total_pages = (total_count + limit - 1) // limit if total_count > 0 else 1
-        print(f"✅ Retrieved {len(questions_list)} questions (Page {page}/{total_pages})")
+        log.info(f"Retrieved {len(questions_list)} questions (Page {page}/{total_pages})")
 
         return jsonify({
             "success": True,
@@ -788,18 +2645,70 @@ def get_questions():
                 "currentPage": page,
                 "totalPages": total_pages,
                 "totalItems": total_count,
-                "itemsPerPage": limit
+                "itemsPerPage": limit,
+                "nextCursor": next_cursor
             }
         }), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Get questions runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get questions runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Get questions error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Get questions error: {e}")
         return jsonify({"success": False, "error": f"Could not load questions: {str(e)}"}), 500
 
 
+@app.route("/getanswers/<question_id>", methods=["GET"])
+def get_answers(question_id):
+    try:
+        questions_collection = get_collection_safe(student_db, "questions")
+        sort = request.args.get('sort', 'votes').lower()
+        if sort not in ANSWER_SORTS:
+            return jsonify({"success": False, "error": "sort must be one of: " + ", ".join(ANSWER_SORTS)}), 400
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+            limit = min(100, max(1, int(request.args.get('limit', 20))))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": "page and limit must be integers"}), 400
+        q_obj = ObjectId(question_id)
+
+        pipeline = [
+            {"$match": {"_id": q_obj}},
+            {"$project": {"answers": 1, "answerCount": {"$size": {"$ifNull": ["$answers", []]}}}},
+            {"$unwind": "$answers"},
+            {"$sort": ANSWER_SORTS[sort]},
+            {"$skip": (page - 1) * limit},
+            {"$limit": limit},
+            {"$group": {"_id": "$_id", "answerCount": {"$first": "$answerCount"}, "answers": {"$push": "$answers"}}}
+        ]
+        result = next(questions_collection.aggregate(pipeline), None)
+        if result is None:
+            # No rows: either the question is missing or the page is past the last answer
+            question = questions_collection.find_one(
+                {"_id": q_obj}, {"answerCount": {"$size": {"$ifNull": ["$answers", []]}}}
+            )
+            if not question:
+                return jsonify({"success": False, "error": "Question not found"}), 404
+            result = {"answerCount": question.get("answerCount", 0), "answers": []}
+
+        total_count = int(result.get("answerCount", 0))
+        return jsonify({
+            "success": True,
+            "answers": [format_answer(a) for a in result.get("answers", [])],
+            "pagination": {
+                "currentPage": page,
+                "totalPages": (total_count + limit - 1) // limit if total_count > 0 else 1,
+                "totalItems": total_count,
+                "itemsPerPage": limit
+            }
+        }), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Get answers runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Get answers error: {e}")
+        return jsonify({"success": False, "error": f"Could not load answers: {str(e)}"}), 500
+
+
 @app.route("/addanswer", methods=["POST"])
 def add_answer():
     try:
@@ -826,16 +2735,16 @@ def add_answer():
 
         result = questions_collection.update_one({"_id": ObjectId(question_id)}, {"$push": {"answers": answer}})
         if result.matched_count > 0:
-            print(f"✅ Answer added to question {question_id}")
+            invalidate_cache("questions")
+            log.info(f"Answer added to question {question_id}")
             return jsonify({"success": True, "message": "Answer posted!"}), 200
         else:
             return jsonify({"error": "Question not found"}), 404
     except RuntimeError as runtime_err:
-        print(f"❌ Add answer runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Add answer runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Add answer error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Add answer error: {e}")
         return jsonify({"error": f"Failed to add answer: {str(e)}"}), 500
 
 
@@ -853,16 +2762,16 @@ def vote_question():
         increment = 1 if vote_type == "up" else -1
         result = questions_collection.update_one({"_id": ObjectId(question_id)}, {"$inc": {"votes": increment}})
         if result.matched_count > 0:
-            print(f"✅ Vote recorded for question {question_id}: {vote_type}")
+            invalidate_cache("questions")
+            log.info(f"Vote recorded for question {question_id}: {vote_type}")
             return jsonify({"success": True}), 200
         else:
             return jsonify({"error": "Question not found"}), 404
     except RuntimeError as runtime_err:
-        print(f"❌ Vote question runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Vote question runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Vote question error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Vote question error: {e}")
         return jsonify({"error": "Failed to vote"}), 500
 
 
@@ -889,16 +2798,16 @@ def accept_answer():
         questions_collection.update_one({"_id": q_obj}, {"$set": {"answers.$[].accepted": False}})
         result = questions_collection.update_one({"_id": q_obj, "answers.answerId": answer_id}, {"$set": {"answers.$.accepted": True}})
         if result.matched_count > 0:
-            print(f"✅ Answer {answer_id} accepted for question {question_id}")
+            invalidate_cache("questions")
+            log.info(f"Answer {answer_id} accepted for question {question_id}")
             return jsonify({"success": True, "message": "Answer accepted!"}), 200
         else:
             return jsonify({"error": "Answer not found"}), 404
     except RuntimeError as runtime_err:
-        print(f"❌ Accept answer runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Accept answer runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Accept answer error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Accept answer error: {e}")
         return jsonify({"error": f"Failed to accept answer: {str(e)}"}), 500
 
 
@@ -920,20 +2829,120 @@ def vote_answer():
         inc = 1 if vote_type == 'up' else -1
         result = questions_collection.update_one({"_id": q_obj, "answers.answerId": answer_id}, {"$inc": {"answers.$.votes": inc}})
         if result.matched_count > 0:
-            print(f"✅ Answer {answer_id} voted {vote_type}")
+            invalidate_cache("questions")
+            log.info(f"Answer {answer_id} voted {vote_type}")
             return jsonify({"success": True, "message": f"Answer {vote_type}voted!"}), 200
         else:
             return jsonify({"error": "Answer not found"}), 404
     except RuntimeError as runtime_err:
-        print(f"❌ Vote answer runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Vote answer runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Vote answer error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Vote answer error: {e}")
         return jsonify({"error": f"Failed to vote on answer: {str(e)}"}), 500
 
 
 # ==================== NOTIFICATIONS ====================
+declare_index("student_network_db", "notifications", [("userId", 1), ("createdAt", -1)])
+declare_index("student_network_db", "notifications", [("groupId", 1), ("fromUserId", 1), ("type", 1)])
+declare_index("student_network_db", "notification_counters", [("userId", 1)], unique=True)
+
+# Retention: read notifications expire NOTIFICATION_READ_TTL_DAYS after being read
+# (TTL index on readAt); `flask compact-notifications` folds repeated join
+# requests and moves anything older than NOTIFICATION_ARCHIVE_AFTER_DAYS to
+# notifications_archive (except unread join requests, which are still actionable).
+NOTIFICATION_READ_TTL_DAYS = int(os.environ.get("NOTIFICATION_READ_TTL_DAYS", 30))
+NOTIFICATION_ARCHIVE_AFTER_DAYS = int(os.environ.get("NOTIFICATION_ARCHIVE_AFTER_DAYS", 90))
+declare_index(
+    "student_network_db", "notifications", [("readAt", 1)],
+    expireAfterSeconds=NOTIFICATION_READ_TTL_DAYS * 24 * 3600
+)
+declare_index("student_network_db", "notifications", [("createdAt", 1)])
+declare_index(
+    "student_network_db", "notifications", [("userId", 1), ("groupId", 1)],
+    name="join_request_digest_unique", unique=True, partialFilterExpression={"type": "join_request_digest"}
+)
+
+
+def archive_notifications(notifications_collection, notifications):
+    """Copy notifications to the cold collection, delete them, and release their unread counts"""
+    if not notifications:
+        return 0
+    archive_collection = get_collection_safe(student_db, "notifications_archive")
+    archived_at = datetime.utcnow()
+    try:
+        archive_collection.insert_many([{**n, "archivedAt": archived_at} for n in notifications], ordered=False)
+    except BulkWriteError as bulk_err:
+        # Rows archived by an interrupted earlier run are already there
+        if any(error.get("code") != 11000 for error in bulk_err.details.get("writeErrors", [])):
+            raise
+    # Unread rows go first, per user, so only those deleted while still unread release a count;
+    # one marked read meanwhile was already decremented by mark_notifications_read
+    unread_ids = defaultdict(list)
+    for notification in notifications:
+        if not notification.get("isRead"):
+            unread_ids[notification["userId"]].append(notification["_id"])
+    ensure_unread_counters(student_db, unread_ids)
+    for user_id, ids in unread_ids.items():
+        deleted = notifications_collection.delete_many({"_id": {"$in": ids}, "isRead": False}).deleted_count
+        adjust_unread_count(user_id, -deleted)
+    notifications_collection.delete_many({"_id": {"$in": [n["_id"] for n in notifications]}})
+    return len(notifications)
+
+
+def compact_join_requests(notifications_collection):
+    """Fold join_request notifications; returns (duplicates archived, digests written).
+
+    Unread requests stay actionable, so only a requester's older repeats are
+    removed. Read (handled) requests for the same group are merged into a
+    single read digest per (userId, groupId), so later runs extend it.
+    """
+    duplicates = 0
+    repeated = notifications_collection.aggregate([
+        {"$match": {"type": "join_request", "isRead": False}},
+        {"$sort": {"createdAt": -1}},
+        {"$group": {"_id": {"u": "$userId", "g": "$groupId", "f": "$fromUserId"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ], allowDiskUse=True)
+    for group in repeated:
+        older = list(notifications_collection.find({"_id": {"$in": group["ids"][1:]}}))
+        duplicates += archive_notifications(notifications_collection, older)
+
+    digests = 0
+    handled = notifications_collection.aggregate([
+        {"$match": {"type": "join_request", "isRead": True}},
+        {"$sort": {"createdAt": -1}},
+        {"$group": {
+            "_id": {"u": "$userId", "g": "$groupId"},
+            "ids": {"$push": "$_id"},
+            "fromUserIds": {"$addToSet": "$fromUserId"},
+            "latestFrom": {"$first": "$fromUserId"},
+            "latestAt": {"$first": "$createdAt"}
+        }},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ], allowDiskUse=True)
+    for group in handled:
+        newer = {"$gt": [group["latestAt"], {"$ifNull": ["$createdAt", datetime.min]}]}
+        notifications_collection.update_one(
+            {"userId": group["_id"]["u"], "groupId": group["_id"]["g"], "type": "join_request_digest"},
+            [
+                {"$set": {
+                    "fromUserId": {"$cond": [newer, {"$literal": group["latestFrom"]}, "$fromUserId"]},
+                    "fromUserIds": {"$setUnion": [{"$ifNull": ["$fromUserIds", []]}, {"$literal": group["fromUserIds"]}]},
+                    "count": {"$add": [{"$ifNull": ["$count", 0]}, len(group["ids"])]},
+                    "isRead": True,
+                    "readAt": datetime.utcnow(),
+                    "createdAt": {"$max": ["$createdAt", group["latestAt"]]}
+                }},
+                {"$set": {"message": {"$concat": [{"$toString": {"$size": "$fromUserIds"}}, " people asked to join your group"]}}}
+            ],
+            upsert=True
+        )
+        originals = list(notifications_collection.find({"_id": {"$in": group["ids"]}}))
+        archive_notifications(notifications_collection, originals)
+        digests += 1
+    return duplicates, digests
+
 @app.route('/getnotifications', methods=['GET'])
 def get_notifications():
     try:
@@ -949,20 +2958,13 @@ def get_notifications():
             {"userId": user_id}
         ).sort("createdAt", -1).limit(50))
 
+        users_by_id = fetch_by_ids(users_collection, [n.get('fromUserId') for n in notifications], {"fullName": 1})
+        groups_by_id = fetch_by_ids(groups_collection, [n.get('groupId') for n in notifications], {"project_name": 1})
+
         data = []
         for notif in notifications:
-            from_user = None
-            group = None
-            try:
-                if notif.get('fromUserId'):
-                    from_user = users_collection.find_one({"_id": ObjectId(notif.get('fromUserId'))})
-            except Exception:
-                from_user = None
-            try:
-                if notif.get('groupId'):
-                    group = groups_collection.find_one({"_id": ObjectId(notif.get('groupId'))})
-            except Exception:
-                group = None
+            from_user = users_by_id.get(str(notif.get('fromUserId')))
+            group = groups_by_id.get(str(notif.get('groupId')))
 
             data.append({
                 "id": str(notif["_id"]),
@@ -973,30 +2975,210 @@ def get_notifications():
                 "unread": not notif.get("isRead", False),
                 "createdAt": notif.get("createdAt", datetime.utcnow()).isoformat(),
                 "groupId": notif.get("groupId"),
+                "groupName": group.get("project_name", "") if group else "",
                 "fromUserId": notif.get("fromUserId"),
             })
 
-        print(f"✅ Retrieved {len(data)} notifications for {user_id}")
+        log.info(f"Retrieved {len(data)} notifications for {user_id}")
         return jsonify({"success": True, "notifications": data}), 200
 
     except Exception as e:
-        print(f"❌ Notification error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Notification error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/notifications/unread-count', methods=['GET'])
+@with_session
+def get_unread_count():
+    try:
+        counters_collection = get_collection_safe(student_db, "notification_counters")
+        user_id = session_user_id(request.args.get('userId'))
+        if not user_id or user_id == 'None':
+            return jsonify({"error": "User ID required"}), 400
+
+        counter = counters_collection.find_one({"userId": user_id}, {"unread": 1})
+        if counter is None:
+            # First read for this user: create the counter from the notifications themselves
+            ensure_unread_counters(student_db, [user_id])
+            counter = counters_collection.find_one({"userId": user_id}, {"unread": 1}) or {}
+        unread = counter.get("unread", 0)
+        return jsonify({"success": True, "unread": max(0, int(unread))}), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Unread count runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Unread count error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/notifications/markread', methods=['POST'])
+@with_session
+def mark_read():
+    try:
+        notifications_collection = get_collection_safe(student_db, "notifications")
+        data = request.get_json() or {}
+        user_id = session_user_id(data.get('userId'))
+        if not user_id or user_id == 'None':
+            return jsonify({"error": "User ID required"}), 400
+
+        query = {"userId": user_id}
+        if not data.get("all"):
+            ids = to_object_ids(data.get("notificationIds") or [])
+            if not ids:
+                return jsonify({"error": "notificationIds or all=true required"}), 400
+            query["_id"] = {"$in": ids}
+        marked = mark_notifications_read(notifications_collection, query)
+        return jsonify({"success": True, "marked": marked}), 200
+    except RuntimeError as runtime_err:
+        log.error(f"Mark read runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Mark read error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 # ==================== DISCUSSIONS ====================
+# Messages live in discussion_messages as buckets of up to MESSAGE_BUCKET_SIZE,
+# so a room's history never grows a single document and reads touch one page.
+MESSAGE_BUCKET_SIZE = int(os.environ.get("MESSAGE_BUCKET_SIZE", 200))
+
+declare_index("student_network_db", "discussions", [("groupId", 1), ("lastMessageTime", -1)])
+declare_index("student_network_db", "discussion_messages", [("discussionId", 1), ("firstId", 1)], unique=True)
+declare_index("student_network_db", "discussion_messages", [("discussionId", 1), ("count", 1)])
+
+
+def append_message(buckets_collection, discussion_id, message):
+    """Push a message into the room's open bucket, opening a new one when it is full"""
+    message_oid = ObjectId(message["messageId"])
+    buckets_collection.update_one(
+        {"discussionId": discussion_id, "count": {"$lt": MESSAGE_BUCKET_SIZE}},
+        {
+            "$push": {"messages": message},
+            "$inc": {"count": 1},
+            "$min": {"firstId": message_oid},
+            "$max": {"lastId": message_oid}
+        },
+        upsert=True
+    )
+
+
+def legacy_object_id(scope, index, timestamp):
+    """Stable ObjectId for an embedded legacy item without one: its timestamp, then a hash of its position"""
+    try:
+        seconds = int(datetime.fromisoformat(str(timestamp)).timestamp())
+    except (TypeError, ValueError):
+        seconds = 0
+    digest = hashlib.sha256(f"{scope}:{index}".encode("utf-8")).digest()
+    return ObjectId(seconds.to_bytes(4, "big") + digest[:8])
+
+
+def migrate_legacy_messages(discussions_collection, buckets_collection, discussion_id):
+    """Move a discussion's embedded messages array into buckets; safe to re-run or run concurrently.
+
+    Buckets are written first, upserted on (discussionId, firstId) with ids
+    that are the same on every run, and the array is only removed once they
+    all exist, so a crash part-way leaves the history in place for a retry.
+    The unique index on (discussionId, firstId) turns a concurrent run's
+    insert of the same bucket into a DuplicateKeyError, which means it is
+    already there.
+    """
+    discussion = discussions_collection.find_one(
+        {"_id": ObjectId(discussion_id), "messages": {"$exists": True}},
+        {"messages": 1}
+    )
+    if not discussion:
+        return 0
+
+    legacy = discussion.get("messages") or []
+    messages = []
+    for index, message in enumerate(legacy):
+        message = dict(message)
+        if not ObjectId.is_valid(str(message.get("messageId"))):
+            message["messageId"] = str(legacy_object_id(discussion_id, index, message.get("timestamp")))
+        messages.append(message)
+
+    for start in range(0, len(messages), MESSAGE_BUCKET_SIZE):
+        chunk = messages[start:start + MESSAGE_BUCKET_SIZE]
+        chunk_ids = [ObjectId(m["messageId"]) for m in chunk]
+        try:
+            buckets_collection.update_one(
+                {"discussionId": str(discussion_id), "firstId": min(chunk_ids)},
+                {"$setOnInsert": {"messages": chunk, "count": len(chunk), "lastId": max(chunk_ids)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+
+    # Only drop the array we copied; another run that got here first has already dropped it
+    result = discussions_collection.update_one(
+        {"_id": ObjectId(discussion_id), "messages": {"$size": len(legacy)}},
+        {"$unset": {"messages": ""}}
+    )
+    return len(messages) if result.modified_count else 0
+
+
+def read_message_page(buckets_collection, discussion_id, before=None, after=None, limit=50):
+    """Return (messages, has_more) for one page, oldest first, reading only the buckets it needs.
+
+    Two senders that find the open bucket full can each open a new one, so
+    bucket id ranges may overlap. Once more than a page is in hand, any other
+    bucket still holding ids on the near side of the page boundary is read
+    too, and the page is sorted by messageId before it is cut.
+    """
+    query = {"discussionId": discussion_id}
+    if after:
+        query["lastId"] = {"$gt": after}
+        direction = 1
+    else:
+        if before:
+            query["firstId"] = {"$lt": before}
+        direction = -1
+
+    def in_range(message):
+        message_id = ObjectId(message["messageId"])
+        return (after is None or message_id > after) and (before is None or message_id < before)
+
+    read_ids = []
+    collected = []
+    buckets = buckets_collection.find(query, {"messages": 1}).sort("firstId", direction).batch_size(2)
+    for bucket in buckets:
+        read_ids.append(bucket["_id"])
+        collected.extend(m for m in bucket.get("messages", []) if in_range(m))
+        if len(collected) > limit:
+            break
+
+    if len(collected) > limit:
+        nearest = sorted((ObjectId(m["messageId"]) for m in collected), reverse=direction < 0)
+        boundary = nearest[limit]
+        overlapping = {**query, "_id": {"$nin": read_ids}}
+        if direction < 0:
+            overlapping["lastId"] = {"$gt": boundary}
+        else:
+            overlapping["firstId"] = {"$lt": boundary}
+        for bucket in buckets_collection.find(overlapping, {"messages": 1}):
+            collected.extend(m for m in bucket.get("messages", []) if in_range(m))
+
+    collected.sort(key=lambda m: ObjectId(m["messageId"]))
+    has_more = len(collected) > limit
+    page = collected[:limit] if after else collected[-limit:]
+    return page, has_more
+
+
 @app.route("/getdiscussions", methods=["GET"])
+@with_session
 def get_discussions():
     try:
         discussions_collection = get_collection_safe(student_db, "discussions")
         groups_collection = get_collection_safe(student_db, "groups")
-        user_id = str(request.args.get('userId'))
+        user_id = session_user_id(request.args.get('userId'))
         if not user_id or user_id == 'None':
             return jsonify({"error": "User ID required"}), 400
 
-        user_groups = list(groups_collection.find({'members': user_id}, {'_id': 1}))
-        group_ids = [str(g['_id']) for g in user_groups]
+        if g.session and g.session["snapshotFresh"]:
+            group_ids = g.session["groups"]
+        else:
+            user_groups = list(groups_collection.find({'members': user_id}, {'_id': 1}))
+            group_ids = [str(group['_id']) for group in user_groups]
 
         discussions = list(discussions_collection.find({'groupId': {'$in': group_ids}}).sort("lastMessageTime", -1).limit(50))
         discussions_list = []
@@ -1014,14 +3196,13 @@ def get_discussions():
                 "groupName": d.get("groupName", ""),
                 "createdAt": d.get("createdAt", datetime.utcnow()).isoformat()
             })
-        print(f"✅ Retrieved {len(discussions_list)} discussions for user {user_id}")
+        log.info(f"Retrieved {len(discussions_list)} discussions for user {user_id}")
         return jsonify({"success": True, "discussions": discussions_list}), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Get discussions runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get discussions runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Get discussions error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Get discussions error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -1051,7 +3232,6 @@ def create_discussion():
             "createdBy": user_id,
             "createdByName": data.get("userName"),
             "participants": [user_id],
-            "messages": [],
             "lastMessage": "",
             "lastMessageTime": datetime.utcnow(),
             "createdAt": datetime.utcnow(),
@@ -1059,78 +3239,95 @@ def create_discussion():
             "groupName": group.get("project_name", "")
         }
         result = discussions_collection.insert_one(discussion)
-        print(f"✅ Discussion created: {discussion['roomName']} | ID: {result.inserted_id}")
+        log.info(f"Discussion created: {discussion['roomName']} | ID: {result.inserted_id}")
         return jsonify({"success": True, "message": "Discussion created!", "discussionId": str(result.inserted_id)}), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Create discussion runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Create discussion runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Create discussion error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Create discussion error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/getmessages/<discussion_id>", methods=["GET"])
+@with_session
 def get_messages(discussion_id):
     try:
         discussions_collection = get_collection_safe(student_db, "discussions")
         groups_collection = get_collection_safe(student_db, "groups")
-        user_id = str(request.args.get('userId'))
+        buckets_collection = get_collection_safe(student_db, "discussion_messages")
+        user_id = session_user_id(request.args.get('userId'))
         if not user_id or user_id == 'None':
             return jsonify({"error": "User ID required"}), 400
 
-        discussion = discussions_collection.find_one({"_id": ObjectId(discussion_id)})
+        try:
+            limit = min(MESSAGE_BUCKET_SIZE, max(1, int(request.args.get('limit', 50))))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+        try:
+            before = ObjectId(request.args['before']) if request.args.get('before') else None
+            after = ObjectId(request.args['after']) if request.args.get('after') else None
+        except Exception:
+            return jsonify({"error": "before/after must be message IDs"}), 400
+
+        discussion = discussions_collection.find_one(
+            {"_id": ObjectId(discussion_id)},
+            {"roomName": 1, "topic": 1, "groupName": 1, "groupId": 1, "hasLegacyMessages": {"$isArray": "$messages"}}
+        )
         if not discussion:
             return jsonify({"error": "Discussion not found"}), 404
 
         group_id = discussion.get("groupId")
-        if group_id:
-            group = groups_collection.find_one({"_id": ObjectId(group_id)})
-            if not group:
-                return jsonify({"error": "Group not found"}), 403
-            members = [str(m) for m in group.get("members", [])]
-            if user_id not in members:
-                return jsonify({"error": "Access denied"}), 403
+        if group_id and not is_group_member(groups_collection, group_id, user_id):
+            return jsonify({"error": "Access denied"}), 403
+
+        if discussion.get("hasLegacyMessages"):
+            migrate_legacy_messages(discussions_collection, buckets_collection, discussion_id)
+
+        messages, has_more = read_message_page(buckets_collection, discussion_id, before, after, limit)
 
         return jsonify({
             "success": True,
-            "messages": discussion.get("messages", []),
+            "messages": messages,
+            "hasMore": has_more,
             "roomName": discussion.get("roomName"),
             "topic": discussion.get("topic", ""),
             "groupName": discussion.get("groupName", "")
         }), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Get messages runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get messages runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Get messages error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Get messages error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/sendmessage", methods=["POST"])
+@with_session
 def send_message():
     try:
         discussions_collection = get_collection_safe(student_db, "discussions")
         groups_collection = get_collection_safe(student_db, "groups")
+        buckets_collection = get_collection_safe(student_db, "discussion_messages")
         data = request.get_json()
         discussion_id = data.get("discussionId")
-        user_id = str(data.get("userId"))
+        user_id = session_user_id(data.get("userId"))
         if not discussion_id or not user_id:
             return jsonify({"error": "Discussion ID and User ID required"}), 400
 
-        discussion = discussions_collection.find_one({"_id": ObjectId(discussion_id)})
+        discussion = discussions_collection.find_one(
+            {"_id": ObjectId(discussion_id)},
+            {"groupId": 1, "hasLegacyMessages": {"$isArray": "$messages"}}
+        )
         if not discussion:
             return jsonify({"error": "Discussion not found"}), 404
 
         group_id = discussion.get("groupId")
-        if group_id:
-            group = groups_collection.find_one({"_id": ObjectId(group_id)})
-            if not group:
-                return jsonify({"error": "Group not found"}), 403
-            members = [str(m) for m in group.get("members", [])]
-            if user_id not in members:
-                return jsonify({"error": "Access denied"}), 403
+        if group_id and not is_group_member(groups_collection, group_id, user_id):
+            return jsonify({"error": "Access denied"}), 403
+
+        if discussion.get("hasLegacyMessages"):
+            migrate_legacy_messages(discussions_collection, buckets_collection, discussion_id)
 
         message = {
             "messageId": str(ObjectId()),
@@ -1144,26 +3341,263 @@ def send_message():
         result = discussions_collection.update_one(
             {"_id": ObjectId(discussion_id)},
             {
-                "$push": {"messages": message},
                 "$set": {"lastMessage": data.get("content"), "lastMessageTime": datetime.utcnow()},
                 "$addToSet": {"participants": user_id}
             }
         )
         if result.matched_count > 0:
-            print(f"✅ Message sent in discussion {discussion_id}")
-            return jsonify({"success": True}), 200
+            append_message(buckets_collection, discussion_id, message)
+            publish_event(f"discussion:{discussion_id}", "newMessage", {**message, "discussionId": discussion_id})
+            log.info(f"Message sent in discussion {discussion_id}")
+            return jsonify({"success": True, "message": message}), 200
         else:
             return jsonify({"error": "Discussion not found"}), 404
     except RuntimeError as runtime_err:
-        print(f"❌ Send message runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Send message runtime error (DB unavailable): {runtime_err}")
+        return jsonify({"error": "Database unavailable"}), 503
+    except Exception as e:
+        log.exception(f"Send message error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/stream/discussion/<discussion_id>", methods=["GET"])
+@with_session
+def stream_discussion(discussion_id):
+    try:
+        discussions_collection = get_collection_safe(student_db, "discussions")
+        groups_collection = get_collection_safe(student_db, "groups")
+        user_id = session_user_id(request.args.get('userId'))
+        if not user_id or user_id == 'None':
+            return jsonify({"error": "User ID required"}), 400
+
+        discussion = discussions_collection.find_one({"_id": ObjectId(discussion_id)}, {"groupId": 1})
+        if not discussion:
+            return jsonify({"error": "Discussion not found"}), 404
+
+        group_id = discussion.get("groupId")
+        if group_id and not is_group_member(groups_collection, group_id, user_id):
+            return jsonify({"error": "Access denied"}), 403
+
+        return event_stream_response(f"discussion:{discussion_id}")
+    except RuntimeError as runtime_err:
+        log.error(f"Stream discussion runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Send message error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Stream discussion error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 # ==================== CHAT ROUTES ====================
+# _id breaks timestamp ties so since/before cursors never skip or repeat a chat.
+# History pages by timestamp (when the chat was sent); since-reads page by
+# insertedAt, stamped just before the row is written, so a chat whose write
+# was delayed still lands ahead of every cursor handed out meanwhile.
+declare_index("chat_db", "chats", [("room", 1), ("timestamp", -1), ("_id", -1)])
+declare_index("chat_db", "chats", [("timestamp", -1), ("_id", -1)])
+declare_index("chat_db", "chats", [("room", 1), ("insertedAt", 1), ("_id", 1)])
+declare_index("chat_db", "chats", [("insertedAt", 1), ("_id", 1)])
+
+
+class ChatWriteBehind:
+    """Acknowledge chats after a durable local append and write them to Mongo in batches.
+
+    Each accepted chat is appended to the active log segment and fsync'd
+    before the request returns. A flusher thread seals the segment when it
+    holds batch_size chats or flush_interval_s has passed, writes it with an
+    unordered insert_many and deletes the file. Segments left behind by a
+    crash are replayed at startup. Every chat has its _id before it is
+    logged, so a replay never duplicates a row; insertedAt is stamped on
+    each write attempt, so a late flush or replay is still new to readers. The active segment is
+    flock'd before it gets its chats-*.log name, and a segment is only
+    deleted by whoever read it under that lock, so another worker's replay
+    can never take a live segment.
+    """
+
+    def __init__(self, get_db, log_dir, batch_size=500, flush_interval_s=0.25, fsync=True):
+        self.get_db = get_db
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = 0
+        self._segment = None
+        self._segment_path = None
+        self._sequence = 0
+        self._worker = None
+        self._worker_pid = None
+        os.makedirs(log_dir, exist_ok=True)
+
+    @staticmethod
+    def _encode(chat):
+        return json.dumps({**chat, "_id": str(chat["_id"]), "timestamp": chat["timestamp"].isoformat()}) + "\n"
+
+    @staticmethod
+    def _decode(line):
+        chat = json.loads(line)
+        chat["_id"] = ObjectId(chat["_id"])
+        chat["timestamp"] = datetime.fromisoformat(chat["timestamp"])
+        return chat
+
+    def _open_segment(self):
+        self._sequence += 1
+        name = f"chats-{os.getpid()}-{int(time.time() * 1000)}-{self._sequence}.log"
+        # Lock under a name flush() does not glob, then publish it; no one else can see the file unlocked
+        staging_path = os.path.join(self.log_dir, f".{name}.new")
+        segment = open(staging_path, "a", encoding="utf-8")
+        if fcntl:
+            fcntl.flock(segment.fileno(), fcntl.LOCK_EX)
+        self._segment_path = os.path.join(self.log_dir, name)
+        os.rename(staging_path, self._segment_path)
+        self._segment = segment
+
+    def append(self, chat):
+        self.start()
+        with self._lock:
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(self._encode(chat))
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._wake.set()
+
+    def start(self):
+        """Start the flusher in this process; its first pass replays segments left by a crash"""
+        if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+            if self._worker_pid is not None and self._worker_pid != os.getpid():
+                # Forked child: the parent's open segment belongs to the parent
+                self._segment, self._segment_path, self._pending = None, None, 0
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+            self._worker.start()
+
+    def _seal(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()  # closing also releases the flock
+                self._segment, self._segment_path, self._pending = None, None, 0
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error(f"Chat flush failed, will retry: {e}")
+
+    def flush(self):
+        """Seal the active segment and write every sealed segment this process owns or can lock"""
+        self._seal()
+        for path in sorted(glob.glob(os.path.join(self.log_dir, "chats-*.log"))):
+            if path != self._segment_path:
+                self._flush_segment(path)
+
+    def _flush_segment(self, path):
+        try:
+            segment = open(path, "r+", encoding="utf-8")
+        except FileNotFoundError:
+            return  # another worker flushed it first
+        with segment:
+            if fcntl:
+                try:
+                    fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # another worker's active segment
+                try:
+                    if os.stat(path).st_ino != os.fstat(segment.fileno()).st_ino:
+                        return
+                except FileNotFoundError:
+                    return  # flushed and removed by another worker while we waited to open it
+            chats = [self._decode(line) for line in segment if line.strip()]
+            if chats:
+                inserted_at = datetime.utcnow()
+                for chat in chats:
+                    chat["insertedAt"] = inserted_at
+                chats_collection = get_collection_safe(self.get_db(), "chats")
+                try:
+                    chats_collection.insert_many(chats, ordered=False)
+                except BulkWriteError as bulk_err:
+                    if any(error.get("code") != 11000 for error in bulk_err.details.get("writeErrors", [])):
+                        raise
+            if fcntl:
+                # Still holding the lock: only the reader of these chats may delete them
+                os.remove(path)
+        if not fcntl:
+            os.remove(path)  # single-process dev (Windows cannot delete an open file)
+
+
+chat_write_behind = None
+if os.environ.get("CHAT_WRITE_BEHIND", "1") == "1":
+    chat_write_behind = ChatWriteBehind(
+        get_db=lambda: chat_db,
+        log_dir=os.environ.get("CHAT_LOG_DIR", "chat_wal"),
+        batch_size=int(os.environ.get("CHAT_BATCH_SIZE", 500)),
+        flush_interval_s=float(os.environ.get("CHAT_FLUSH_INTERVAL", 0.25)),
+        fsync=os.environ.get("CHAT_WAL_FSYNC", "1") == "1"
+    )
+    chat_write_behind.start()
+    atexit.register(chat_write_behind.flush)
+
+CHAT_PAGE_MAX = 200
+CHAT_LONG_POLL_MAX_S = float(os.environ.get("CHAT_LONG_POLL_MAX", 25))
+CHAT_LONG_POLL_STEP_S = 1.0
+# since-reads stop this far behind now on insertedAt, so a batch stamped but
+# still being written by another worker cannot land behind a client's cursor
+CHAT_READ_SETTLE_S = float(os.environ.get("CHAT_READ_SETTLE", 1.0 if chat_write_behind else 0))
+CHAT_PROJECTION = {"username": 1, "message": 1, "room": 1, "timestamp": 1, "insertedAt": 1}
+# Greater than any real ObjectId: a cursor at (t, CURSOR_ID_MAX) covers everything inserted up to t
+CURSOR_ID_MAX = ObjectId("f" * 24)
+
+
+def format_chat(c):
+    return {
+        "_id": str(c["_id"]),
+        "username": c.get("username"),
+        "message": c.get("message"),
+        "room": c.get("room"),
+        "timestamp": c["timestamp"].isoformat() if c.get("timestamp") else None
+    }
+
+
+def settled_until():
+    return datetime.utcnow() - timedelta(seconds=CHAT_READ_SETTLE_S)
+
+
+def read_chats_since(chats_collection, query, since, limit):
+    """Chats written after the since cursor, in insert order"""
+    delta_query = {**query, **keyset_filter("insertedAt", since[0], since[1], direction=1)}
+    delta_query["insertedAt"] = {"$lte": settled_until()}
+    return list(chats_collection.find(delta_query, CHAT_PROJECTION)
+                .sort([("insertedAt", 1), ("_id", 1)]).limit(limit + 1))
+
+
+def wait_for_chats(chats_collection, query, since, limit, room, wait_s):
+    """Long poll: re-read every CHAT_LONG_POLL_STEP_S (sooner on a local newChat) until chats arrive or wait_s passes"""
+    deadline = time.time() + wait_s
+    subscriber = pubsub.subscribe(f"chat:{room}") if room else None
+    try:
+        chats = read_chats_since(chats_collection, query, since, limit)
+        while not chats and time.time() < deadline:
+            step = min(CHAT_LONG_POLL_STEP_S, deadline - time.time())
+            if subscriber:
+                try:
+                    subscriber.get(timeout=step)
+                    time.sleep(CHAT_READ_SETTLE_S)
+                except queue.Empty:
+                    pass
+            else:
+                time.sleep(step)
+            chats = read_chats_since(chats_collection, query, since, limit)
+        return chats
+    finally:
+        if subscriber:
+            pubsub.unsubscribe(f"chat:{room}", subscriber)
+
 @app.route('/chat', methods=['POST'])
 def save_chat():
     try:
@@ -1175,16 +3609,25 @@ def save_chat():
         if not username or not message:
             return jsonify({"error": "Username and message required"}), 400
 
-        chat = {"username": username, "message": message, "room": room, "timestamp": datetime.utcnow()}
-        result = chats_collection.insert_one(chat)
-        print(f"✅ Chat saved: {username} in {room}")
-        return jsonify({"success": True, "chatId": str(result.inserted_id)}), 201
+        chat = {"_id": ObjectId(), "username": username, "message": message, "room": room, "timestamp": datetime.utcnow()}
+        if chat_write_behind:
+            chat_write_behind.append(chat)
+        else:
+            chats_collection.insert_one({**chat, "insertedAt": datetime.utcnow()})
+        publish_event(f"chat:{room}", "newChat", {
+            "_id": str(chat["_id"]),
+            "username": username,
+            "message": message,
+            "room": room,
+            "timestamp": chat["timestamp"].isoformat()
+        })
+        log.info(f"Chat saved: {username} in {room}")
+        return jsonify({"success": True, "chatId": str(chat["_id"])}), 201
     except RuntimeError as runtime_err:
-        print(f"❌ Save chat runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Save chat runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Save chat error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Save chat error: {e}")
         return jsonify({"error": "Failed to save chat"}), 500
 
 
@@ -1193,22 +3636,71 @@ def get_chats():
     try:
         chats_collection = get_collection_safe(chat_db, "chats")
         room = request.args.get('room', None)
+        since_arg = request.args.get('since')
+        before_arg = request.args.get('before')
+        if since_arg and before_arg:
+            return jsonify({"error": "Use either since or before, not both"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), CHAT_PAGE_MAX)
+            wait_s = min(max(float(request.args.get('wait', 0)), 0), CHAT_LONG_POLL_MAX_S)
+            since = decode_cursor(since_arg) if since_arg else None
+            before = decode_cursor(before_arg) if before_arg else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         query = {"room": room} if room else {}
-        chats = list(chats_collection.find(query).sort("timestamp", -1).limit(100))
-        for c in chats:
-            c['_id'] = str(c['_id'])
-            c['timestamp'] = c['timestamp'].isoformat() if 'timestamp' in c else None
-        print(f"✅ Retrieved {len(chats)} chats")
-        return jsonify({"success": True, "chats": chats}), 200
+        if since:
+            # Delta mode: chats newer than the client's last one, oldest first
+            if wait_s and acquire_stream_slot():
+                try:
+                    chats = wait_for_chats(chats_collection, query, since, limit, room, wait_s)
+                finally:
+                    release_stream_slot()
+            else:
+                # No wait requested, or every stream slot is busy: answer immediately
+                chats = read_chats_since(chats_collection, query, since, limit)
+            has_more = len(chats) > limit
+            chats = chats[:limit]
+            next_since = encode_cursor(chats[-1]["insertedAt"], chats[-1]["_id"]) if chats else since_arg
+            next_before = None
+        else:
+            # Window mode: the newest chats (or those before a cursor), newest first
+            settled = settled_until()
+            if before:
+                query.update(keyset_filter("timestamp", before[0], before[1], direction=-1))
+            else:
+                # Same bound as delta reads (rows from before insertedAt existed count as settled),
+                # so nextSince picks up exactly where this window stops
+                query["insertedAt"] = {"$not": {"$gt": settled}}
+            chats = list(chats_collection.find(query, CHAT_PROJECTION)
+                         .sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1))
+            has_more = len(chats) > limit
+            chats = chats[:limit]
+            next_since = None if before else encode_cursor(settled, CURSOR_ID_MAX)
+            next_before = encode_cursor(chats[-1]["timestamp"], chats[-1]["_id"]) if has_more else None
+
+        log.info(f"Retrieved {len(chats)} chats")
+        return jsonify({
+            "success": True,
+            "chats": [format_chat(c) for c in chats],
+            "hasMore": has_more,
+            "nextSince": next_since,
+            "nextBefore": next_before
+        }), 200
     except RuntimeError as runtime_err:
-        print(f"❌ Get chats runtime error (DB unavailable): {runtime_err}")
+        log.error(f"Get chats runtime error (DB unavailable): {runtime_err}")
         return jsonify({"error": "Database unavailable"}), 503
     except Exception as e:
-        print(f"❌ Get chats error: {e}")
-        traceback.print_exc(limit=1)
+        log.exception(f"Get chats error: {e}")
         return jsonify({"error": "Failed to get chats"}), 500
 
 
+@app.route('/stream/chat', methods=['GET'])
+def stream_chat():
+    room = request.args.get('room', 'general')
+    return event_stream_response(f"chat:{room}")
+
+
 # ==================== HEALTH & TEST ====================
 @app.route('/health', methods=['GET'])
 def health():
@@ -1223,6 +3715,28 @@ def health():
     return jsonify({"status": "healthy", "database": db_status, "timestamp": datetime.utcnow().isoformat()}), 200
 
 
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    routes = {}
+    with cache_stats_lock:
+        snapshot = {endpoint: dict(stats) for endpoint, stats in cache_stats.items()}
+    for endpoint, stats in snapshot.items():
+        lookups = stats["hits"] + stats["misses"]
+        routes[endpoint] = {**stats, "hitRate": round(stats["hits"] / lookups, 3) if lookups else 0.0}
+    return jsonify({
+        "success": True,
+        "enabled": RESPONSE_CACHE_ENABLED,
+        "backend": type(cache_backend).__name__,
+        "routes": routes
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    metrics.set("log_records_dropped_total", {}, log_handler.dropped)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/test', methods=['GET'])
 def test():
     return jsonify({
@@ -1233,18 +3747,231 @@ def test():
         },
         "endpoints": {
             "auth": ["/signup [POST]", "/login [POST]"],
-            "profile": ["/updateprofile [POST]", "/getuser/<user_id> [GET]"],
+            "profile": ["/updateprofile [POST]", "/getuser/<user_id> [GET]", "/getusers?ids= [GET]"],
             "groups": ["/getavailablegroups [GET/POST]", "/creategroup [POST]", "/joingroup [POST]", "/leavegroup [POST]", "/getmygroups [GET]"],
-            "posts": ["/createpost [POST]", "/getposts [GET]"],
-            "qa": ["/createquestion [POST]", "/getquestions [GET]", "/addanswer [POST]", "/votequestion [POST]", "/acceptanswer [POST]", "/voteanswer [POST]"],
-            "discussions": ["/getdiscussions [GET]", "/creatediscussion [POST]", "/getmessages/<id> [GET]", "/sendmessage [POST]"],
-            "chat": ["/chat [POST]", "/chats [GET]"],
-            "notifications": ["/getnotifications [GET]"],
-            "utility": ["/health [GET]", "/test [GET]"]
+            "posts": ["/createpost [POST]", "/getposts [GET]", "/likepost [POST]", "/unlikepost [POST]", "/addcomment [POST]", "/getcomments/<id> [GET]"],
+            "qa": ["/createquestion [POST]", "/getquestions [GET]", "/getanswers/<id> [GET]", "/addanswer [POST]", "/votequestion [POST]", "/acceptanswer [POST]", "/voteanswer [POST]"],
+            "discussions": ["/getdiscussions [GET]", "/creatediscussion [POST]", "/getmessages/<id> [GET]", "/sendmessage [POST]", "/stream/discussion/<id> [GET, SSE]"],
+            "chat": ["/chat [POST]", "/chats [GET]", "/stream/chat [GET, SSE]"],
+            "notifications": ["/getnotifications [GET]", "/notifications/unread-count [GET]", "/notifications/markread [POST]"],
+            "utility": ["/health [GET]", "/test [GET]", "/cache/stats [GET]", "/metrics [GET]"]
         }
     }), 200
 
 
+# ==================== MAINTENANCE COMMANDS ====================
+@app.cli.command("backfill-max-members")
+def backfill_max_members():
+    """Store the numeric maxMembers on groups created before it was written at insert time"""
+    groups_collection = get_collection_safe(student_db, "groups")
+    updated = 0
+    for group in groups_collection.find({"maxMembers": {"$exists": False}}, {"preferred_team_size": 1}):
+        groups_collection.update_one(
+            {"_id": group["_id"]},
+            {"$set": {"maxMembers": parse_team_size(group.get("preferred_team_size"))}}
+        )
+        updated += 1
+    print(f"✅ Backfilled maxMembers on {updated} groups")
+
+
+@app.cli.command("backfill-member-counts")
+def backfill_member_counts():
+    """Store memberCount on groups created before it was maintained by membership updates"""
+    groups_collection = get_collection_safe(student_db, "groups")
+    result = groups_collection.update_many(
+        {"memberCount": {"$exists": False}},
+        [{"$set": {"memberCount": {"$size": {"$ifNull": ["$members", []]}}}}]
+    )
+    print(f"✅ Backfilled memberCount on {result.modified_count} groups")
+
+
+@app.cli.command("migrate-discussion-messages")
+def migrate_discussion_messages():
+    """Move every embedded discussions.messages array into discussion_messages buckets"""
+    discussions_collection = get_collection_safe(student_db, "discussions")
+    buckets_collection = get_collection_safe(student_db, "discussion_messages")
+    migrated_rooms = migrated_messages = 0
+    for discussion in discussions_collection.find({"messages": {"$exists": True}}, {"_id": 1}):
+        migrated_messages += migrate_legacy_messages(discussions_collection, buckets_collection, str(discussion["_id"]))
+        migrated_rooms += 1
+    print(f"✅ Migrated {migrated_messages} messages from {migrated_rooms} discussions")
+
+
+@app.cli.command("normalize-user-ids")
+def normalize_user_ids():
+    """Re-key string _ids as ObjectIds and drop redundant id fields so users have one canonical id"""
+    users_collection = get_collection_safe(student_db, "users")
+    rekeyed = unset = 0
+    for user in users_collection.find({"_id": {"$type": "string"}}):
+        legacy_id = user["_id"]
+        if not ObjectId.is_valid(legacy_id):
+            # Other collections store this id as-is; rewriting them is a separate migration
+            print(f"⚠️  Left {legacy_id!r}: not an ObjectId string")
+            continue
+        if user.get("id") == legacy_id:
+            del user["id"]
+
+        def rekey(session):
+            # Delete first so the unique email index does not see two copies of the user;
+            # the transaction puts the original back if the insert fails.
+            users_collection.delete_one({"_id": legacy_id}, session=session)
+            # Same hex string, so memberships, posts and sessions that store it keep matching
+            users_collection.insert_one({**user, "_id": ObjectId(legacy_id)}, session=session)
+
+        try:
+            with mongo_client.start_session() as session:
+                session.with_transaction(rekey)
+        except Exception as e:
+            print(f"❌ Left {legacy_id!r}: {e}")
+            continue
+        rekeyed += 1
+    for user in users_collection.find({"id": {"$exists": True}}, {"id": 1}):
+        if str(user["id"]) == str(user["_id"]):
+            users_collection.update_one({"_id": user["_id"]}, {"$unset": {"id": ""}})
+            unset += 1
+        else:
+            print(f"⚠️  Left {user['_id']}: id field {user['id']!r} differs from _id")
+    print(f"✅ Re-keyed {rekeyed} users and removed {unset} redundant id fields")
+    remaining = users_collection.count_documents({"$or": [{"_id": {"$type": "string"}}, {"id": {"$exists": True}}]})
+    if remaining:
+        print(f"⚠️  {remaining} users still have legacy ids; keep USER_IDS_NORMALIZED=0")
+    else:
+        print("✅ All user ids are canonical; USER_IDS_NORMALIZED=1 is safe")
+
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create any missing declared indexes"""
+    created, failed = ensure_indexes()
+    print(f"✅ {len(created)} indexes ensured")
+    for failure in failed:
+        print(f"❌ {failure}")
+
+
+@app.cli.command("index-report")
+def index_report_command():
+    """List declared indexes that are missing and existing indexes with no recorded use"""
+    missing, unused = index_report()
+    print(f"Missing ({len(missing)}):")
+    for name in missing:
+        print(f"   • {name}")
+    print(f"Unused since last restart ({len(unused)}):")
+    for name in unused:
+        print(f"   • {name}")
+
+
+@app.cli.command("backfill-search-terms")
+def backfill_search_terms():
+    """Store searchTerms on questions that lack them or were tokenized by an older rule; safe to re-run"""
+    questions_collection = get_collection_safe(student_db, "questions")
+    updated = 0
+    for question in questions_collection.find({}, {"title": 1, "tags": 1, "searchTerms": 1}):
+        terms = question_search_terms(question.get("title"), question.get("tags"))
+        if question.get("searchTerms") != terms:
+            questions_collection.update_one({"_id": question["_id"]}, {"$set": {"searchTerms": terms}})
+            updated += 1
+    print(f"✅ Backfilled searchTerms on {updated} questions")
+
+
+@app.cli.command("migrate-post-engagement")
+def migrate_post_engagement():
+    """Move embedded posts.likes/comments arrays into post_likes/post_comments with counters; safe to re-run.
+
+    Counters are seeded from the array sizes first (a no-op where /likepost or
+    /addcomment already seeded them), then likes and comments are upserted on
+    keys that are the same on every run, and the arrays are removed last.
+    """
+    posts_collection = get_collection_safe(student_db, "posts")
+    likes_collection = get_collection_safe(student_db, "post_likes")
+    comments_collection = get_collection_safe(student_db, "post_comments")
+    migrated = 0
+    legacy = {"$or": [{"likes": {"$exists": True}}, {"comments": {"$exists": True}}]}
+    for post in posts_collection.find(legacy, {"likes": 1, "comments": 1}):
+        posts_collection.update_one(
+            {"_id": post["_id"]},
+            [{"$set": {"likeCount": LIKE_COUNT_EXPR, "commentCount": COMMENT_COUNT_EXPR}}]
+        )
+        liker_ids = {str(user_id) for user_id in post.get("likes") or []}
+        if liker_ids:
+            likes_collection.bulk_write([
+                UpdateOne(
+                    {"postId": post["_id"], "userId": liker_id},
+                    {"$setOnInsert": {"createdAt": datetime.utcnow()}},
+                    upsert=True
+                ) for liker_id in liker_ids
+            ], ordered=False)
+        comment_writes = []
+        for index, comment in enumerate(post.get("comments") or []):
+            comment = dict(comment) if isinstance(comment, dict) else {"content": str(comment)}
+            comment_id = comment.pop("_id", None)
+            if not isinstance(comment_id, ObjectId):
+                comment_id = legacy_object_id(f"{post['_id']}/comments", index, comment.get("createdAt") or comment.get("timestamp"))
+            comment_writes.append(UpdateOne(
+                {"_id": comment_id},
+                {"$setOnInsert": {**comment, "postId": post["_id"]}},
+                upsert=True
+            ))
+        if comment_writes:
+            comments_collection.bulk_write(comment_writes, ordered=False)
+        posts_collection.update_one({"_id": post["_id"]}, {"$unset": {"likes": "", "comments": ""}})
+        migrated += 1
+    print(f"✅ Migrated likes/comments on {migrated} posts")
+
+
+@app.cli.command("recount-unread")
+def recount_unread():
+    """Rebuild notification_counters from the notifications collection"""
+    notifications_collection = get_collection_safe(student_db, "notifications")
+    counters_collection = get_collection_safe(student_db, "notification_counters")
+    totals = {row["_id"]: row["unread"] for row in notifications_collection.aggregate([
+        {"$match": {"isRead": False}},
+        {"$group": {"_id": "$userId", "unread": {"$sum": 1}}}
+    ])}
+    counters_collection.update_many({"userId": {"$nin": list(totals)}}, {"$set": {"unread": 0}})
+    if totals:
+        counters_collection.bulk_write([
+            UpdateOne({"userId": user_id}, {"$set": {"unread": unread}}, upsert=True)
+            for user_id, unread in totals.items()
+        ], ordered=False)
+    print(f"✅ Recounted unread notifications for {len(totals)} users")
+
+
+@app.cli.command("compact-notifications")
+def compact_notifications():
+    """Fold repeated join requests, archive old notifications, and report collection size"""
+    notifications_collection = get_collection_safe(student_db, "notifications")
+
+    def size_line():
+        stats = student_db.command("collStats", "notifications")
+        return (f"{stats.get('count', 0)} docs, {stats.get('size', 0) / 1024:.1f} KB data, "
+                f"{stats.get('totalIndexSize', 0) / 1024:.1f} KB indexes")
+
+    print(f"Before: {size_line()}")
+    # Notifications read before readAt existed would otherwise never reach the TTL index
+    stamped = notifications_collection.update_many(
+        {"isRead": True, "readAt": {"$exists": False}}, {"$set": {"readAt": datetime.utcnow()}}
+    ).modified_count
+    duplicates, digests = compact_join_requests(notifications_collection)
+    cutoff = datetime.utcnow() - timedelta(days=NOTIFICATION_ARCHIVE_AFTER_DAYS)
+    archived = 0
+    while True:
+        # Unread join requests stay: notifications.html is where the leader accepts or rejects them
+        old = list(notifications_collection.find({
+            "createdAt": {"$lt": cutoff},
+            "$nor": [{"type": "join_request", "isRead": False}]
+        }).limit(1000))
+        if not old:
+            break
+        archived += archive_notifications(notifications_collection, old)
+    print(f"✅ Stamped readAt on {stamped} read notifications")
+    print(f"✅ Archived {duplicates} repeated join requests, wrote {digests} digests, archived {archived} old notifications")
+    print(f"After:  {size_line()}")
+
+
+# Every declare_index call above has run by now
+ensure_indexes_on_boot()
+
+
 # ==================== START SERVER ====================
 if __name__ == "__main__":
     print("\n" + "=" * 70)
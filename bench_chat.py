@@ -0,0 +1,86 @@
+# bench_chat.py — POST /chat messages/sec with and without the write-behind buffer
+# Usage: start a local mongod, then
+#   MONGO_URI=mongodb://127.0.0.1:27017 python bench_chat.py
+#   python bench_chat.py --writers 64 --messages 5000
+#
+# Boots `gunicorn -c gunicorn.conf.py app:app` once with CHAT_WRITE_BEHIND=0
+# (insert_one per request) and once with CHAT_WRITE_BEHIND=1 (fsync'd local
+# log, batched insert_many), then posts chats from concurrent writers.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_load import free_port, wait_until_up
+
+
+def timed_post(args):
+    url, body = args
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        urllib.request.urlopen(request, timeout=30).read()
+        ok = True
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run(write_behind, args):
+    port = free_port()
+    env = dict(os.environ, CHAT_WRITE_BEHIND="1" if write_behind else "0", FLASK_HOST="127.0.0.1",
+               FLASK_PORT=str(port), GUNICORN_WORKERS=str(args.workers), ENSURE_INDEXES_ON_BOOT="1",
+               CHAT_LOG_DIR=tempfile.mkdtemp(prefix="chat_wal_"))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        if not wait_until_up(base_url):
+            print("❌ server did not start")
+            return None
+        jobs = [(base_url + "/chat", {"username": f"bench{i % args.writers}", "message": f"message {i}",
+                                      "room": f"bench-{i % 8}"}) for i in range(args.messages)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.writers) as pool:
+            results = list(pool.map(timed_post, jobs))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()  # SIGTERM runs the atexit flush of any buffered chats
+        server.wait(timeout=10)
+
+    latencies = sorted(r[0] for r in results)
+    return {
+        "mode": "write-behind" if write_behind else "insert_one",
+        "mps": len(results) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": sum(1 for r in results if not r[1]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare POST /chat messages/sec with and without write-behind")
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    if not os.environ.get("MONGO_URI"):
+        print("Set MONGO_URI to a local mongod, e.g. mongodb://127.0.0.1:27017")
+        sys.exit(2)
+
+    print(f"{'mode':<14}{'msg/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for write_behind in (False, True):
+        row = run(write_behind, args)
+        if row:
+            print(f"{row['mode']:<14}{row['mps']:>10.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['errors']:>8}")
@@ -0,0 +1,107 @@
+# bench_load.py — requests/sec of the read API under each gunicorn worker mode
+# Usage: start a local mongod, then
+#   MONGO_URI=mongodb://127.0.0.1:27017 python bench_load.py
+#   python bench_load.py --modes sync gthread --concurrency 64 --requests 3000
+#
+# Each mode boots `gunicorn -c gunicorn.conf.py app:app` on a free port, waits
+# for /health, then hammers a mix of read endpoints from a thread pool. The
+# response cache is off unless --cache is given, so the numbers measure the
+# handlers and Mongo rather than cache hits.
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = [
+    "/health",
+    "/getavailablegroups?limit=20",
+    "/getquestions?limit=5",
+    "/getposts",
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url, timeout_s=30):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/health", timeout=1).read()
+            return True
+        except Exception:
+            time.sleep(0.25)
+    return False
+
+
+def timed_get(url):
+    start = time.perf_counter()
+    try:
+        urllib.request.urlopen(url, timeout=30).read()
+        ok = True
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_mode(mode, args):
+    port = free_port()
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=mode, FLASK_HOST="127.0.0.1", FLASK_PORT=str(port),
+               GUNICORN_WORKERS=str(args.workers), ENSURE_INDEXES_ON_BOOT="1",
+               RESPONSE_CACHE_ENABLED="1" if args.cache else "0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        if not wait_until_up(base_url):
+            print(f"❌ {mode}: server did not start")
+            return None
+        urls = [base_url + ENDPOINTS[i % len(ENDPOINTS)] for i in range(args.requests)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(timed_get, urls))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if not r[1])
+    return {
+        "mode": mode,
+        "rps": len(results) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare requests/sec across gunicorn worker modes")
+    parser.add_argument("--modes", nargs="+", default=["sync", "gthread"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--cache", action="store_true", help="leave the response cache on")
+    args = parser.parse_args()
+
+    if not os.environ.get("MONGO_URI"):
+        print("Set MONGO_URI to a local mongod, e.g. mongodb://127.0.0.1:27017")
+        sys.exit(2)
+
+    print(f"{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for mode in args.modes:
+        row = run_mode(mode, args)
+        if row:
+            print(f"{row['mode']:<10}{row['rps']:>10.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['errors']:>8}")
@@ -0,0 +1,29 @@
+# gunicorn.conf.py — worker settings for `gunicorn -c gunicorn.conf.py app:app`
+#
+# Every route spends most of its time waiting on Atlas round trips, so a
+# worker should keep many requests in flight instead of one:
+#   gthread (default)  thread pool per worker, no extra dependency
+#   sync               one request per process, the previous behaviour
+# Greenlet workers (gevent/eventlet) are refused: monkey-patching turns the
+# bcrypt pool's threads into greenlets, and every hash would then block the
+# whole hub, serializing logins.
+import os
+
+bind = f"{os.environ.get('FLASK_HOST', '0.0.0.0')}:{os.environ.get('FLASK_PORT', '5000')}"
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class not in ("gthread", "sync"):
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be gthread or sync, not {worker_class!r}")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+
+# gthread: concurrent requests per worker
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+
+# Live updates (SSE streams and /chats long polls) reach every worker through a
+# change stream on Mongo (PUBSUB_BACKEND=auto picks it on a replica set such as
+# Atlas). On a standalone mongod they stay in-process: run GUNICORN_WORKERS=1.
+# Each open stream holds a thread; MAX_STREAMS_PER_WORKER (default 16) keeps
+# the rest of `threads` free for ordinary requests.
+
+# SSE streams (/stream/...) stay open; keep them from being killed as hung workers
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = 5
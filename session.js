@@ -0,0 +1,54 @@
+// Session token handling shared by the pages that call session-aware endpoints.
+// /login issues a signed token that lets the server skip re-checking ids against
+// the DB. The server slides it in X-Session-Token, flags a dead one with
+// X-Session-Invalid, or answers 401 when tokens are required.
+(function () {
+    const nativeFetch = window.fetch.bind(window);
+    window.fetch = async (...args) => {
+        const response = await nativeFetch(...args);
+        const refreshed = response.headers.get('X-Session-Token');
+        if (refreshed) localStorage.setItem('huddleToken', refreshed);
+        if (response.headers.get('X-Session-Invalid')) localStorage.removeItem('huddleToken');
+        if (response.status === 401 && localStorage.getItem('huddleToken')) {
+            localStorage.removeItem('huddleToken');
+            localStorage.removeItem('huddleUser');
+            window.location.href = 'login.html';
+        }
+        return response;
+    };
+})();
+
+function authHeaders() {
+    const token = localStorage.getItem('huddleToken');
+    return token ? { 'Authorization': `Bearer ${token}` } : {};
+}
+
+// Unread badge on the notifications nav link, read from the server-side counter
+async function refreshUnreadBadge() {
+    const links = document.querySelectorAll('[data-page="notifications"]');
+    const user = JSON.parse(localStorage.getItem('huddleUser') || 'null');
+    if (!links.length || !user) return;
+    try {
+        const response = await fetch(
+            `${window.location.origin}/notifications/unread-count?userId=${encodeURIComponent(user.id)}`,
+            { headers: authHeaders() }
+        );
+        const data = await response.json();
+        if (!data.success) return;
+        links.forEach(link => {
+            let badge = link.querySelector('.unread-badge');
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'unread-badge';
+                badge.style.cssText = 'margin-left:6px; padding:0 6px; border-radius:9px; background:#c0392b; color:#fff; font-size:0.7rem; font-weight:600; line-height:18px;';
+                link.appendChild(badge);
+            }
+            badge.textContent = data.unread > 99 ? '99+' : String(data.unread);
+            badge.style.display = data.unread ? 'inline-block' : 'none';
+        });
+    } catch (err) {
+        console.error('Failed to load unread count:', err);
+    }
+}
+
+document.addEventListener('DOMContentLoaded', refreshUnreadBadge);
@@ -0,0 +1,126 @@
+# stress_membership.py — fire parallel accepts/joins at one group and check it never overfills
+# Usage: start a local mongod, then
+#   MONGO_URI=mongodb://127.0.0.1:27017 python stress_membership.py
+#   python stress_membership.py --applicants 200 --capacity 5 --rounds 10
+#
+# Each round creates a group with room for `capacity` members and
+# `applicants` pending requests, then posts every accept at once, plus a burst
+# of duplicate /joingroup calls from one user. The group must end with at most
+# `capacity` members, memberCount equal to len(members), and exactly one
+# successful join.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from bench_load import free_port, wait_until_up
+
+
+def post(url, body, barrier):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    barrier.wait()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return None
+
+
+def fire(url, bodies):
+    barrier = threading.Barrier(len(bodies))
+    with ThreadPoolExecutor(max_workers=len(bodies)) as pool:
+        return list(pool.map(lambda body: post(url, body, barrier), bodies))
+
+
+def run_round(db, base_url, args):
+    groups = db["groups"]
+    leader = str(ObjectId())
+    applicants = [str(ObjectId()) for _ in range(args.applicants)]
+    group_id = groups.insert_one({
+        "creatoruserid": leader,
+        "project_name": f"stress-{datetime.utcnow().isoformat()}",
+        "preferred_team_size": str(args.capacity),
+        "maxMembers": args.capacity,
+        "members": [leader],
+        "memberCount": 1,
+        "pendingMembers": applicants,
+        "createdAt": datetime.utcnow()
+    }).inserted_id
+    try:
+        accepts = fire(base_url + "/acceptjoinrequest", [
+            {"groupId": str(group_id), "userId": applicant, "leaderId": leader} for applicant in applicants
+        ])
+        # Free a seat so the duplicate joins below are decided by the pending check, not capacity
+        groups.update_one({"_id": group_id}, [
+            {"$set": {"members": [leader], "pendingMembers": []}},
+            {"$set": {"memberCount": 1}}
+        ])
+        joiner = str(ObjectId())
+        joins = fire(base_url + "/joingroup", [{"user_id": joiner, "group_id": str(group_id)}] * args.duplicate_joins)
+        accepted = len([s for s in accepts if s == 200])
+
+        group = groups.find_one({"_id": group_id})
+        problems = []
+        if accepted != args.capacity - 1:
+            problems.append(f"{accepted} accepts succeeded, expected {args.capacity - 1}")
+        if any(s not in (200, 409) for s in accepts):
+            problems.append(f"unexpected accept statuses {sorted(set(accepts), key=str)}")
+        if group["pendingMembers"].count(joiner) != 1 or joins.count(200) != 1:
+            problems.append(f"{joins.count(200)} duplicate joins succeeded, expected 1")
+        if group.get("memberCount") != len(group["members"]):
+            problems.append(f"memberCount {group.get('memberCount')} != {len(group['members'])} members")
+        return problems
+    finally:
+        groups.delete_one({"_id": group_id})
+        db["notifications"].delete_many({"groupId": str(group_id)})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check membership updates stay within capacity under parallel requests")
+    parser.add_argument("--applicants", type=int, default=100)
+    parser.add_argument("--capacity", type=int, default=5)
+    parser.add_argument("--duplicate-joins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        print("Set MONGO_URI to a local mongod, e.g. mongodb://127.0.0.1:27017")
+        sys.exit(2)
+    db = MongoClient(mongo_uri)["student_network_db"]
+
+    port = free_port()
+    env = dict(os.environ, FLASK_HOST="127.0.0.1", FLASK_PORT=str(port), GUNICORN_WORKERS=str(args.workers),
+               REQUIRE_SESSION_TOKEN="0", RESPONSE_CACHE_ENABLED="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    failures = 0
+    try:
+        if not wait_until_up(base_url):
+            print("❌ server did not start")
+            sys.exit(1)
+        for round_number in range(1, args.rounds + 1):
+            problems = run_round(db, base_url, args)
+            failures += bool(problems)
+            print(f"{'✅' if not problems else '❌'} round {round_number}: {'; '.join(problems) or 'ok'}")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    sys.exit(1 if failures else 0)